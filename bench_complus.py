@@ -0,0 +1,410 @@
+"""
+    Benchmarks for plot_complus.py.  Each benchmark generates
+    its own synthetic mon_complus.vbs log in a temporary folder,
+    so no real log is needed.
+
+Syntax:
+    %prog [benchmark,...] [options]
+
+Benchmarks:
+    filter      -- ProcessFilter with 1, 10 and 100 patterns, with
+                   and without its memo, in rows/second.
+    pipeline    -- seconds spent in each stage of plotting a log of
+                   many processes: LogParser.parse_logs(),
+                   make_time_series(), and save_graph() to each of
+                   the VALID_EXTS.
+    startup     -- seconds from starting plot_complus.py to its
+                   first line of output, and to the end of a
+                   saved graph of a small log.
+    timestamps  -- timestamp_to_sec() against TimestampParser,
+                   in samples/second.
+
+Examples:
+1)  Run all benchmarks with the default sizes:
+    %prog
+
+2)  Run the timestamp benchmark on a smaller log:
+    %prog timestamps -n 100000
+
+3)  Time the pipeline on a week of 50 processes restarting twice,
+    and save the results to compare with the next release:
+    %prog pipeline -p 50 --hours 168 --restarts 2 --json week.json
+
+
+Requirement:
+    Python 2.4+, plot_complus.py (and what it requires)
+"""
+
+import sys, os, optparse, tempfile, shutil, subprocess
+from time import time, mktime, localtime
+try:
+    import json
+except ImportError:
+    json = None             # Python 2.5 or earlier: no --json.
+
+import plot_complus
+
+
+USAGE = __doc__
+CHUNK_ROWS = 100000     # Timestamps converted per timed batch.
+FILTER_ROWS = 1000000   # At most, rows matched by the filter benchmark.
+FILTER_NAMES = 300      # Distinct process names in those rows.
+STARTUP_RUNS = 5        # The startup benchmark reports the median run.
+STARTUP_ROWS = 1000
+BANNER = "Microsoft (R) Windows Script Host Version 5.6\n\n"
+PROCESS_NAMES = ["RBCWSSession", "RBCWSUserInfo", "System", "svchost"]
+
+
+def format_timestamp(sec):
+    """
+    Format seconds since the epoch the way VBScript's now()
+    does in mon_complus.vbs, ie, date only on the dot at
+    midnight.
+
+    Behaviour:
+        >>> format_timestamp(mktime((2007, 4, 3, 22, 5, 7, 0, 0, -1)))
+        '4/3/2007 10:05:07 PM'
+        >>> format_timestamp(mktime((2007, 4, 4, 0, 0, 0, 0, 0, -1)))
+        '4/4/2007'
+    """
+    t = localtime(sec)
+    if t.tm_hour == 0 and t.tm_min == 0 and t.tm_sec == 0:
+        return "%d/%d/%d" % (t.tm_mon, t.tm_mday, t.tm_year)
+    if t.tm_hour < 12:
+        am_pm = "AM"
+    else:
+        am_pm = "PM"
+    return "%d/%d/%d %d:%02d:%02d %s" % (t.tm_mon, t.tm_mday, t.tm_year,
+            (t.tm_hour % 12) or 12, t.tm_min, t.tm_sec, am_pm)
+
+
+def process_name(number, restart):
+    """
+    Return the ProcessName(ID) field of a process, after a number
+    of restarts, each of which gives it a new PID.
+
+    Behaviour:
+        >>> process_name(0, 0), process_name(0, 1), process_name(5, 0)
+        ('RBCWSSession(6520)', 'RBCWSSession(16520)', 'App5(6540)')
+    """
+    if number < len(PROCESS_NAMES):
+        name = PROCESS_NAMES[number]
+    else:
+        name = "App%d" % number
+    return "%s(%d)" % (name, 6520 + 4 * number + 10000 * restart)
+
+
+def generate_log(path, rows, interval=5, processes=1, blank_rows=0,
+                 restarts=0):
+    """
+    Write a log the way mon_complus.vbs run by cscript writes it:
+    a banner, the header, then a row per process per sample, with
+    the date only on the dot at midnight.  The private bytes of
+    each process grow by a byte per sample.
+
+    path -- the log file to create.
+    rows -- the number of samples of each process.
+    interval -- seconds between two samples.
+    processes -- the number of processes sampled.
+    blank_rows -- write a blank ",,,,,,," row every this many
+                  samples, as mon_complus.vbs does on WMI errors
+                  (0 for none).
+    restarts -- the number of times each process restarts (with
+                a new PID) over the log.
+    """
+    start = mktime((2007, 4, 3, 10, 0, 0, 0, 0, -1))
+    log_file = open(path, "w")
+    try:
+        log_file.write(BANNER)
+        log_file.write("Time,ComputerName,ProcessName(ID),%ProcessorTime,"
+                "%UserTime,ThreadCount,PrivateBytes,WorkingSet\n")
+        for i in xrange(rows):
+            timestamp = format_timestamp(start + i * interval)
+            restart = i * (restarts + 1) // rows
+            for number in xrange(processes):
+                log_file.write("%s,.,%s,%d,%d,%d,%d,%d\n" % (timestamp,
+                        process_name(number, restart), (i + number) % 100,
+                        (i + number) % 50, 31 + number, 30000000 + i,
+                        37974016 + 4096 * number))
+            if blank_rows and i % blank_rows == blank_rows - 1:
+                log_file.write(",,,,,,,\n")
+    finally:
+        log_file.close()
+
+
+def read_time_column(path):
+    """
+    Yield lists of up to CHUNK_ROWS timestamps from a log.
+    """
+    chunk = []
+    for line in open(path, "r"):
+        fields = line.split(",", 1)
+        if len(fields) == 2 and fields[0] and fields[0] != "Time":
+            chunk.append(fields[0])
+            if len(chunk) == CHUNK_ROWS:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def time_conversion(path, convert):
+    """
+    Return (samples, seconds) spent converting the time column
+    of a log with the convert function.
+    """
+    samples, elapsed = 0, 0.0
+    for chunk in read_time_column(path):
+        started = time()
+        convert(chunk)
+        elapsed += time() - started
+        samples += len(chunk)
+    return samples, elapsed
+
+
+def bench_timestamps(work_dir, options):
+    """
+    Compare the per-row strptime conversion against the cached
+    TimestampParser conversion of a whole time column.
+    """
+    path = os.path.join(work_dir, "timestamps.txt")
+    generate_log(path, options.rows)
+
+    def legacy(chunk):
+        return [plot_complus.timestamp_to_sec(t) for t in chunk]
+
+    results = {}
+    for name, convert in [
+            ("strptime", legacy),
+            ("TimestampParser", plot_complus.TimestampParser().convert)]:
+        samples, elapsed = time_conversion(path, convert)
+        results[name] = samples / max(elapsed, 1e-9)
+        print "%-16s %10d samples %8.2f s %12.0f samples/s" % (
+                name, samples, elapsed, results[name])
+
+    print "Speed up: %.1fx" % (
+            results["TimestampParser"] / results["strptime"])
+    return results
+
+
+def bench_filter(work_dir, options):
+    """
+    Match the process names of a log against ProcessFilters of
+    1, 10 and 100 patterns, both through the memo of the filter
+    and straight through its regular expression.
+    """
+    names = ["App%d(%d)" % (i, 1000 + i) for i in xrange(FILTER_NAMES)]
+    rows = [names[i % FILTER_NAMES]
+            for i in xrange(min(options.rows, FILTER_ROWS))]
+
+    results = {}
+    for count in (1, 10, 100):
+        patterns = ",".join(["App%d" % (i * 7) for i in xrange(count)])
+        speeds = []
+        for match in (plot_complus.ProcessFilter(patterns)._matches,
+                      plot_complus.ProcessFilter(patterns).__contains__):
+            started = time()
+            for name in rows:
+                match(name)
+            speeds.append(len(rows) / max(time() - started, 1e-9))
+        print "%3d patterns %12.0f rows/s uncached %12.0f rows/s memoized" \
+                " (%.1fx)" % (count, speeds[0], speeds[1],
+                speeds[1] / speeds[0])
+        results["%d patterns" % count] = {"uncached": speeds[0],
+                                          "memoized": speeds[1]}
+    return results
+
+
+def time_first_output(command):
+    """
+    Run a command.  Return (seconds to its first line of output,
+    seconds to its exit).
+    """
+    started = time()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE)
+    child.stdout.readline()
+    first_output = time() - started
+    child.communicate()
+    if child.returncode != 0:
+        raise RuntimeError("%s failed!" % " ".join(command))
+    return first_output, time() - started
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def bench_startup(work_dir, options):
+    """
+    Time plot_complus.py the way scripts run it from cron: import
+    alone, and saving the graph of a small log (no cache), from
+    the start of the interpreter to its first line of output and
+    to its exit.
+    """
+    path = os.path.join(work_dir, "startup.txt")
+    generate_log(path, STARTUP_ROWS)
+    script = os.path.splitext(os.path.abspath(plot_complus.__file__))[0]
+    script += ".py"
+
+    runs = [
+        ("import", [sys.executable, "-c",
+            "import sys; sys.path.insert(0, %r); import plot_complus; "
+            "print 'matplotlib' in sys.modules" % os.path.dirname(script)]),
+        ("save graph", [sys.executable, script, path, "--no-cache",
+            "-o", os.path.join(work_dir, "startup.png")]),
+    ]
+    results = {}
+    for name, command in runs:
+        times = [time_first_output(command) for i in xrange(STARTUP_RUNS)]
+        results[name] = {"first output": median([t[0] for t in times]),
+                         "exit": median([t[1] for t in times])}
+        print "%-16s first output %6.3f s, exit %6.3f s" % (name,
+                results[name]["first output"], results[name]["exit"])
+    return results
+
+
+def bench_pipeline(work_dir, options):
+    """
+    Time each stage of plotting a generated log of options.processes
+    processes over options.hours: parsing it (without a cache),
+    making the elapsed time series of each process, and saving the
+    graph of all processes to each of the VALID_EXTS.  Saving a
+    graph makes the time series again, so the make_time_series
+    stage is taken off its time, and the stages do not overlap.
+    What plot_complus prints while drawing is left out.
+    """
+    path = os.path.join(work_dir, "pipeline.txt")
+    rows = max(1, int(options.hours * 3600 / options.interval))
+    generate_log(path, rows, options.interval, options.processes,
+                 options.blank_rows, options.restarts)
+    results = {"rows": rows * options.processes,
+               "bytes": os.path.getsize(path)}
+
+    series_filter = plot_complus.SeriesFilter(
+            plot_complus.SERIES_WE_ARE_INTERESTED_IN)
+    parser = plot_complus.LogParser(plot_complus.AllProcesses(),
+                                    series_filter)
+    started = time()
+    processes = parser.parse_logs(path)
+    results["parse_logs"] = time() - started
+    print "%-16s %10d rows %8.2f s %12.0f rows/s" % ("parse_logs",
+            results["rows"], results["parse_logs"],
+            results["rows"] / max(results["parse_logs"], 1e-9))
+
+    started = time()
+    for p in processes:
+        plot_complus.make_time_series(p.time_series)
+    results["make_time_series"] = time() - started
+    print "%-16s %10d processes %5.2f s" % ("make_time_series",
+            len(processes), results["make_time_series"])
+
+    results["save_graph"] = {}
+    for ext in plot_complus.VALID_EXTS:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")  # The colour of each process.
+        skipped = None
+        started = time()
+        try:
+            try:
+                plot_complus.save_graph(processes, series_filter,
+                        os.path.join(work_dir, "pipeline" + ext))
+                results["save_graph"][ext] = max(0.0, time() - started -
+                        results["make_time_series"])
+            except Exception, err:
+                # Eg, .jpg without PIL installed, or any other error
+                # of the backend of the format.
+                results["save_graph"][ext] = None
+                skipped = err
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        if skipped is not None:
+            print "%-16s %10s skipped: %s" % ("save_graph", ext, skipped)
+        else:
+            print "%-16s %10s %14.2f s" % ("save_graph", ext,
+                    results["save_graph"][ext])
+    return results
+
+
+BENCHMARKS = {
+    "filter": bench_filter,
+    "pipeline": bench_pipeline,
+    "startup": bench_startup,
+    "timestamps": bench_timestamps,
+}
+
+
+def main():
+    p = optparse.OptionParser(USAGE)
+    p.add_option("-n", "--rows", dest="rows", type="int", default=10000000,
+            help="Number of sample rows in the generated log.")
+    p.add_option("-p", "--processes", dest="processes", type="int",
+            default=20,
+            help="pipeline: number of processes in the generated log"
+            " [default: %default].")
+    p.add_option("--hours", dest="hours", type="float", default=24,
+            help="pipeline: hours of samples in the generated log"
+            " [default: %default].")
+    p.add_option("-i", "--interval", dest="interval", type="float",
+            default=5,
+            help="pipeline: seconds between two samples [default: %default].")
+    p.add_option("--blank-rows", dest="blank_rows", type="int", default=0,
+            help="pipeline: write a blank row every this many samples.")
+    p.add_option("--restarts", dest="restarts", type="int", default=0,
+            help="pipeline: times each process restarts with a new PID.")
+    p.add_option("--json", dest="json_path",
+            help="Also save the results to this file as JSON.")
+    (options, args) = p.parse_args()
+
+    if args:
+        names = args[0].split(",")
+    else:
+        names = sorted(BENCHMARKS.keys())
+
+    for name in names:
+        if name not in BENCHMARKS:
+            print >> sys.stderr, "Unknown benchmark: %s" % name
+            sys.exit(1)
+
+    if options.json_path and json is None:
+        print >> sys.stderr, "--json needs Python 2.6 or later!"
+        sys.exit(1)
+
+    if options.processes < 1 or options.hours <= 0 or options.interval <= 0 \
+            or options.blank_rows < 0 or options.restarts < 0:
+        print >> sys.stderr, "-p, --hours and -i must be positive numbers," \
+                " --blank-rows and --restarts cannot be negative!"
+        sys.exit(1)
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="bench_complus")
+    try:
+        for name in names:
+            print "== %s" % name
+            results[name] = BENCHMARKS[name](work_dir, options)
+    finally:
+        shutil.rmtree(work_dir)
+
+    if options.json_path:
+        report = {"version": plot_complus.VERSION,
+                  "python": sys.version.split()[0],
+                  "platform": sys.platform,
+                  "time": time(),
+                  "options": {"rows": options.rows,
+                              "processes": options.processes,
+                              "hours": options.hours,
+                              "interval": options.interval,
+                              "blank_rows": options.blank_rows,
+                              "restarts": options.restarts},
+                  "results": results}
+        out = open(options.json_path, "w")
+        try:
+            json.dump(report, out, indent=2, sort_keys=True)
+            out.write("\n")
+        finally:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -28,49 +28,147 @@ Examples:
 5)  Same as above, but save it to a file:
     %prog log1.txt process1,process2 -o graph.png
 
+    Or pick the processes with wildcards instead of regular expressions:
+    %prog log1.txt "RBCWS*,dllhost" -m glob -o graph.png
+
 6)  Save a graph for each process in a log to a folder:
     %prog log1.txt -a graph_folder
 
+7)  Plot a month-long log with about 1000 points per line:
+    %prog month_log.txt process1 -r 1000 -o graph.png
+
+8)  Parse 4 log files at the same time (on 4 cores):
+    %prog log1.txt,log2.txt,log3.txt,log4.txt process1 -j 4
+
+    Or save the graphs of -a 4 at a time:
+    %prog log1.txt -a graph_folder -j 4
+
+9)  Watch the last hour of a log as mon_complus.vbs writes it:
+    %prog log1.txt process1 -f --window 60
+
+10) Print the summary statistics of all processes in 2 logs as CSV:
+    %prog log1.txt,log2.txt -s csv > stats.csv
+
+11) Rank the processes of a week of logs by memory growth, and save
+    the graph of the 5 fastest growing ones:
+    %prog mon1.txt,mon2.txt,mon3.txt -l --top 5 -o leaks.png
+
+12) Plot half an hour of a month-long log, without parsing the rest:
+    %prog month.txt process1 --from "2007-04-03 14:00" --to "2007-04-03 14:30"
+
+13) Export a log once, then plot from the export instead of the log:
+    %prog log1.txt -e log1_export
+    %prog log1_export process1 -o graph.png
+
+14) Plot compressed log files (.gz, .bz2, .xz or .zst) as they are:
+    %prog log1.txt.gz,log2.txt.bz2 process1
+
+15) Plot the working set and the threads of a process, then all
+    series, derived ones included, without parsing the log again:
+    %prog log1.txt process1 --series WorkingSet,ThreadCount
+    %prog log1.txt process1 --series all
+
+16) See where the time of a run goes, and profile its parsing:
+    %prog log1.txt process1 -o graph.png --profile --profile-dump parse.prof
+    python -c "import pstats; pstats.Stats('parse.prof').print_stats(20)"
+
+17) Compare the COM+ applications of a farm, a log (or a folder of
+    logs) per host, host by host, then their total across hosts:
+    %prog web01.txt,web02.txt,web03.txt --farm hosts -o farm.png
+    %prog farm_logs --farm sum -j 4 -o farm_total.png
+
+18) Compare a process in 2 runs on a 1 minute grid, then plot the
+    second run minus the first:
+    %prog before.txt,after.txt process1 --resample mean --step 60
+    %prog before.txt,after.txt process1 --diff
+
+19) Save a report of all processes in a log, a page per process,
+    with an HTML index of the pages:
+    %prog log1.txt --report report.pdf --report-html report.html
+
 
 Requirement:
     Python 2.4+, matplotlib, Numpy
+    lzma (or backports.lzma) for .xz logs, zstandard for .zst logs
 """
 
 # Ie, what y-axis do you want in the output graph?
-# Choices of MemorySeries and DefaultSeries.
+# Choices of the SERIES below, or see the --series option.
 SERIES_WE_ARE_INTERESTED_IN = [
     ("%ProcessorTime", "DefaultSeries"),
     ("PrivateBytes",   "MemorySeries"),
 ]
 
+# The series class of each column of mon_complus.vbs, and of the
+# series derived from them.  Any other column is a DefaultSeries.
+SERIES = {
+    "%ProcessorTime":        "DefaultSeries",
+    "%UserTime":             "DefaultSeries",
+    "%KernelTime":           "KernelTimeSeries",
+    "ThreadCount":           "DefaultSeries",
+    "PrivateBytes":          "MemorySeries",
+    "PrivateBytesPerThread": "BytesPerThreadSeries",
+    "WorkingSet":            "MemorySeries",
+}
+
 
 USAGE = __doc__
 VERSION = "1.3"
 DEFAULT_EXT = ".png"
 VALID_EXTS = (DEFAULT_EXT, ".jpg", ".pdf", ".svg")
+DEFAULT_CACHE_DIR = "~/.plot_complus"
+DEFAULT_CACHE_SIZE = 1024   # MB
+DEFAULT_FOLLOW_INTERVAL = 5 # Seconds, as REFRESH_IN_MSEC in mon_complus.vbs.
+DEFAULT_STEP = 60           # Seconds, the grid of --farm and --resample.
 
 
 # BUGS:
 # 1.    Save file is not in "landscape" (wait for upstream (matplotlib) to fix)
-# 2.    When creating a lot of graphs using "-a", it might fail with error:
-#       Fail to create pixmap with Tk_GetPixmap in ImgPhotoInstanceSetSize.
-#       This is a Tk bug upstream.  A temporary solution when encounter this
-#       is to set the value of the GDIProcessHandleQuota in
-#       HKEY_LOCAL_MACHINE/SOFTWARE/Microsoft/Windows NT/Windows to a higher
-#       value.
-# 3.    It currently use a lot of RAM (with a possible leak); To minimize the
-#       use of RAM, we can optimize by using array.array on number series;
-#       use __slots__ on process objects...etc.
 
 
-import sys, os, csv, random, re, optparse
-from time import strptime, mktime
-import pylab as g
+import sys, os, mmap, random, re, optparse, csv
+import cPickle, copy_reg, gzip, bz2, threading, Queue, atexit
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5     # Python 2.4
+from tempfile import mkstemp
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None  # Python 2.5 or earlier: no --jobs.
+try:
+    import json
+except ImportError:
+    json = None             # Python 2.5 or earlier: no --stats json.
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None         # No .xz log files.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None        # No .zst log files.
+try:
+    import resource
+except ImportError:
+    resource = None         # Windows: no peak RSS in --profile.
+from array import array
+from bisect import bisect_left, bisect_right
+from fnmatch import fnmatchcase
+from time import strptime, mktime, strftime, localtime, time as clock
+from math import log
+import numpy
+# matplotlib is only imported when a graph is drawn, see plot_graph().
 
 
 class DefaultSeries:
-    marker = "-"
-    unit   = ""
+    marker   = "-"
+    unit     = ""
+    typecode = "d"  # How the transformed values are stored in a Process.
     def __init__(self, name):
         self.name   = name
         self.index  = None
@@ -91,6 +189,32 @@ class DefaultSeries:
         except:
             return 0 # Oh well, best compromise we can do.
 
+    def transform_column(self, column):
+        """
+        Transform a whole column of values that have already been
+        through DefaultSeries.transform(), eg, read from a LogCache.
+        """
+        return column
+
+    def column_names(self):
+        """
+        Return the names of the columns the series is read from.
+        """
+        return (self.name,)
+
+    def parse(self, fields):
+        """
+        Return the transformed value of the series in the fields
+        of a log line.
+        """
+        return self.transform(fields[self.index])
+
+    def transform_columns(self, columns):
+        """
+        Transform whole columns, one per name in column_names().
+        """
+        return self.transform_column(columns[0])
+
 
 class MemorySeries(DefaultSeries):
     unit = "(MB)"
@@ -112,6 +236,87 @@ class MemorySeries(DefaultSeries):
         except:
             return 0 # Oh well, best compromise we can do.
 
+    def transform_column(self, column):
+        """
+        Behaviour:
+            >>> s = MemorySeries("PrivateBytes")
+            >>> s.transform_column(array("d", [12345678, 0]))
+            array('d', [12.345678, 0.0])
+        """
+        result = array(self.typecode)
+        result.fromstring((as_ndarray(column) / 1000000.0).tostring())
+        return result
+
+
+class DerivedSeries(DefaultSeries):
+    """
+    A series computed from other columns of a log file, rather
+    than read from a column of its own.  Subclasses name these
+    columns in inputs and combine their values in derive(), which
+    takes single values as well as whole NumPy columns, so a series
+    cached or exported as its inputs is derived in one go.
+
+    Its index is the tuple of the indexes of its inputs.
+    """
+    inputs = ()
+
+    def column_names(self):
+        return self.inputs
+
+    def parse(self, fields):
+        return self.derive(*[DefaultSeries.transform(self, fields[i])
+                             for i in self.index])
+
+    def transform_columns(self, columns):
+        """
+        Behaviour:
+            >>> s = KernelTimeSeries("%KernelTime")
+            >>> s.transform_columns([array("d", [30, 5]), array("d", [20, 5])])
+            array('d', [10.0, 0.0])
+        """
+        values = self.derive(*[as_ndarray(c) for c in columns])
+        result = array(self.typecode)
+        result.fromstring(values.astype(numpy.float64).tostring())
+        return result
+
+
+class KernelTimeSeries(DerivedSeries):
+    inputs = ("%ProcessorTime", "%UserTime")
+    def derive(self, processor_time, user_time):
+        """
+        The processor time not spent in user mode.
+
+        Behaviour:
+            >>> s = KernelTimeSeries("%KernelTime")
+            >>> s.index = (3, 4)
+            >>> s.parse(["4/3/2007", ".", "App(1)", "30", "20"])
+            10
+        """
+        return processor_time - user_time
+
+
+class BytesPerThreadSeries(DerivedSeries):
+    unit = "(KB)"
+    inputs = ("PrivateBytes", "ThreadCount")
+    def derive(self, private_bytes, thread_count):
+        """
+        The private KBytes per thread, eg, to tell a leak from a
+        process merely starting more threads.
+
+        Behaviour:
+            >>> s = BytesPerThreadSeries("PrivateBytesPerThread")
+            >>> s.index = (3, 4)
+            >>> s.parse(["4/3/2007", ".", "App(1)", "500000", "4"])
+            125.0
+            >>> s.parse(["4/3/2007", ".", "App(1)", "500000", ""])
+            500.0
+        """
+        return private_bytes / 1000.0 / numpy.maximum(thread_count, 1)
+
+
+SERIES_CLASSES = dict([(cls.__name__, cls) for cls in (DefaultSeries,
+        MemorySeries, KernelTimeSeries, BytesPerThreadSeries)])
+
 
 
 def random_colour_generator():
@@ -214,6 +419,9 @@ COLOURS = random_colour_generator()
 
 class UsageError(Exception):
     def __init__(self, msg=""):
+        # Pass msg up too, so the error survives pickling
+        # back from a worker process.
+        Exception.__init__(self, msg)
         self.msg = msg
 
 
@@ -244,6 +452,20 @@ class SeriesFilter:
         >>> f.initialize(header)
         >>>
 
+    A derived series is found by its inputs:
+        >>> header = ['Time','CN','PN','%ProcessorTime','%UserTime']
+        >>> f = SeriesFilter([("%KernelTime", "KernelTimeSeries")])
+        >>> f.initialize(header)
+        >>> f.series[0].name, f.series[0].index
+        ('%KernelTime', (3, 4))
+
+    No user preference is every series of the log, and every
+    series derived from it:
+        >>> f = SeriesFilter(None)
+        >>> f.initialize(header)
+        >>> [(s.name, s.__class__.__name__) for s in f.series]
+        [('%ProcessorTime', 'DefaultSeries'), ('%UserTime', 'DefaultSeries'), ('%KernelTime', 'KernelTimeSeries')]
+
     It should throw an error if no columns match:
         >>> header = ['Time','','','','','','']
         >>> f = SeriesFilter(user_preference)
@@ -251,13 +473,14 @@ class SeriesFilter:
         Traceback (most recent call last):
         ...
             raise UsageError("Desired columns not found in log files!")
-        UsageError: <unprintable instance object>
+        UsageError: Desired columns not found in log files!
     """
     def __init__(self, user_preference):
         """
         user_preference -- a list of (column_name, series_class),
                            containing the series/columns the user
-                           is interested in.
+                           is interested in (see SERIES), or
+                           None for all of them.
         """
         self.user_desired_series = user_preference
         self.series = []
@@ -269,19 +492,74 @@ class SeriesFilter:
 
         header -- a list of string, each component a column name.
         """
-        header_length = len(header)
-        for name, cls_name in self.user_desired_series:
+        preference = self.user_desired_series
+        if preference is None:
+            preference = [(name, SERIES.get(name, "DefaultSeries"))
+                          for name in header[3:]]
+            preference += [(name, cls_name) for name, cls_name in
+                           sorted(SERIES.items()) if issubclass(
+                           SERIES_CLASSES[cls_name], DerivedSeries)]
 
-            for i in range(header_length):
-                if name == header[i]:
-                    c = globals()[cls_name](name)
-                    c.index = i
-                    self.series.append(c)
-                    break
+        for name, cls_name in preference:
+            c = SERIES_CLASSES[cls_name](name)
+            try:
+                indexes = [header.index(n) for n in c.column_names()]
+            except ValueError:
+                continue    # Not in this log file.
+            if isinstance(c, DerivedSeries):
+                c.index = tuple(indexes)
+            else:
+                c.index = indexes[0]
+            self.series.append(c)
 
         if len(self.series) == 0:
             raise UsageError("Desired columns not found in log files!")
 
+    def fresh(self):
+        """
+        Return a new, not yet initialized, filter of the same kind.
+        """
+        return self.__class__(self.user_desired_series)
+
+
+class AllSeries(SeriesFilter):
+    """
+    A series filter that takes every column after Time, Computer
+    Name and Process Name as a DefaultSeries, to parse everything
+    in a log file at once.
+
+    Behaviour:
+        >>> f = AllSeries()
+        >>> f.initialize(['Time','CN','PN','%ProcessorTime','PrivateBytes'])
+        >>> [(s.name, s.index) for s in f.series]
+        [('%ProcessorTime', 3), ('PrivateBytes', 4)]
+    """
+    def __init__(self, user_preference=None):
+        SeriesFilter.__init__(self, user_preference)
+
+    def initialize(self, header):
+        for i in range(3, len(header)):
+            c = DefaultSeries(header[i])
+            c.index = i
+            self.series.append(c)
+
+
+def series_preference(text):
+    """
+    Return the user preference of a SeriesFilter out of the comma
+    separated series names of the --series option, None for "all".
+
+    Behaviour:
+        >>> series_preference("WorkingSet,%KernelTime,Handles")
+        [('WorkingSet', 'MemorySeries'), ('%KernelTime', 'KernelTimeSeries'), ('Handles', 'DefaultSeries')]
+        >>> series_preference("all") is None
+        True
+    """
+    if text == "all":
+        return None
+    return [(name, SERIES.get(name, "DefaultSeries"))
+            for name in text.split(",") if name]
+
 
 class ProcessFilter:
     """
@@ -289,6 +567,22 @@ class ProcessFilter:
     user is interested in when parsing a
     log file.
 
+    A pattern matches a process name (case insensitive) in one
+    of the MODES:
+        regex  -- the pattern is a regular expression found
+                  anywhere in the name (the default).
+        exact  -- the name is the pattern, with or without
+                  the process ID.
+        prefix -- the name starts with the pattern.
+        glob   -- the name (with or without the process ID)
+                  matches the pattern, with *, ? and [...]
+                  wildcards.
+
+    As a log holds the same few hundred names over and over, the
+    verdict for every name is remembered, so matching a row mostly
+    costs a dict lookup.  The memo is cleared whenever it holds
+    MAX_NAMES names, to bound its size on unusual logs.
+
     Behaviour:
         >>> f = ProcessFilter("session")
         >>> "RBCWSSession" in f
@@ -310,24 +604,88 @@ class ProcessFilter:
         False
         >>> "" in f
         False
+
+    The other modes:
+        >>> f = ProcessFilter("rbcwssession,System(4)", "exact")
+        >>> "RBCWSSession(6520)" in f, "RBCWSSession2(6521)" in f
+        (True, False)
+        >>> "System(4)" in f, "System(8)" in f
+        (True, False)
+        >>> f = ProcessFilter("rbcws", "prefix")
+        >>> "RBCWSUserInfo(10496)" in f, "MyRBCWS(1)" in f
+        (True, False)
+        >>> f = ProcessFilter("RBCWS*o,dllhost", "glob")
+        >>> "RBCWSUserInfo(10496)" in f, "RBCWSSession(6520)" in f
+        (True, False)
+        >>> "dllhost(7788)" in f
+        True
+        >>> ProcessFilter("session", "fuzzy")
+        Traceback (most recent call last):
+        UsageError: Unknown pattern mode: fuzzy
     """
-    def __init__(self, name_patterns):
+
+    MODES = ("regex", "exact", "prefix", "glob")
+    MAX_NAMES = 10000
+
+    def __init__(self, name_patterns, mode="regex"):
         """
         name_patterns -- a string of process name patterns
                          separated by comma that the user
                          is interested in.
+        mode -- how the patterns match, one of MODES.
         """
-        patterns = ["(%s)+" % p for p in name_patterns.split(",")]
-        self._regex = re.compile("|".join(patterns), re.IGNORECASE)
+        if mode not in self.MODES:
+            raise UsageError("Unknown pattern mode: %s" % mode)
+        self.mode = mode
+        self.patterns = [p.lower() for p in name_patterns.split(",")]
+        if mode == "regex":
+            patterns = ["(?:%s)+" % p for p in name_patterns.split(",")]
+            try:
+                self._regex = re.compile("|".join(patterns), re.IGNORECASE)
+            except re.error, err:
+                raise UsageError("Invalid pattern %s: %s"
+                        % (name_patterns, err))
+        self._verdicts = {}     # Process name -> True or False.
 
     def __contains__(self, process_name):
         """
         Return True if process_name is one of the processes
         the user is interested in, False otherwise.
         """
-        if self._regex.search(process_name) is None:
+        try:
+            return self._verdicts[process_name]
+        except KeyError:
+            if len(self._verdicts) >= self.MAX_NAMES:
+                self._verdicts.clear()
+            verdict = self._matches(process_name)
+            self._verdicts[process_name] = verdict
+            return verdict
+
+    def _matches(self, process_name):
+        """
+        Match process_name against the patterns, without the memo.
+        """
+        if self.mode == "regex":
+            return self._regex.search(process_name) is not None
+
+        name = process_name.lower()
+        if self.mode == "prefix":
+            for p in self.patterns:
+                if name.startswith(p):
+                    return True
             return False
-        return True
+
+        names = (name, name.split("(", 1)[0])
+        if self.mode == "exact":
+            for p in self.patterns:
+                if p in names:
+                    return True
+        else:
+            for p in self.patterns:
+                for n in names:
+                    if fnmatchcase(n, p):
+                        return True
+        return False
 
 
 class AllProcesses:
@@ -348,27 +706,37 @@ class AllProcesses:
         return True
 
 
-class Process:
+class Process(object):
     """
     A representation of a process.  Contains its identity,
     the time series and other column/metrics series.
 
+    Every series is stored column by column in a typed, growable
+    array.array (8 bytes per sample), and the time series holds
+    the timestamps as seconds since the epoch.
+
     Behaviour:
         >>> p = Process("RBCWSSession(1234)", "test_log.txt")
         >>> p.process_name, p.process_id, p.id
         ('RBCWSSession', '1234', 'RBCWSSession(1234) test_log.txt')
 
-        >>> p.set("PrivateBytes", "1000")
-        >>> p.set("PrivateBytes", "2000")
-        >>> p.set("PrivateBytes", "3000")
+        >>> p.set("PrivateBytes", 1000)
+        >>> p.set("PrivateBytes", 2000)
+        >>> p.set("PrivateBytes", 3000)
         >>> p.get("PrivateBytes")
-        ['1000', '2000', '3000']
+        array('d', [1000.0, 2000.0, 3000.0])
 
-        >>> p.set("%ProcessorTime", "40")
+        >>> p.set("%ProcessorTime", 40)
         >>> p.get("%ProcessorTime")
-        ['40']
+        array('d', [40.0])
         >>> p.get("PrivateBytes")
-        ['1000', '2000', '3000']
+        array('d', [1000.0, 2000.0, 3000.0])
+
+    A column can be fetched (and created) up front, so a
+    parser can append to it directly:
+        >>> p.column("ThreadCount").append(31)
+        >>> p.get("ThreadCount")
+        array('d', [31.0])
 
     An abnormal case here. It does happen sometimes:
         >>> p = Process("()", "test_log.txt")
@@ -376,6 +744,9 @@ class Process:
         ('', '', '() test_log.txt')
     """
 
+    __slots__ = ("process_name_and_id", "process_name", "process_id",
+                 "log_filename", "id", "time_series", "_series")
+
     _pattern = re.compile("[()]")
 
     def __init__(self, process_name_and_id, log_filename):
@@ -384,17 +755,32 @@ class Process:
                                ProcessName(ProcessId).
         log_filename -- a string of the filename (no path).
         """
+        self.process_name_and_id = process_name_and_id
         self.process_name, self.process_id, dummy = \
                 self._pattern.split(process_name_and_id, maxsplit=2)
         self.log_filename   = log_filename
         self.id             = Process.compose_id(process_name_and_id, log_filename)
-        self.time_series    = []
+        self.time_series    = array("d")
+        self._series        = {}
 
     def get(self, series):
         """
         Return a series.
         """
-        return getattr(self, series)
+        return self._series[series]
+
+    def column(self, series, typecode="d"):
+        """
+        Return the array holding a series, creating an
+        empty one if the series has no value yet.
+
+        series -- a string of the series name.
+        typecode -- the array.array typecode of a new column.
+        """
+        col = self._series.get(series)
+        if col is None:
+            col = self._series[series] = array(typecode)
+        return col
 
     def set(self, series, value):
         """
@@ -402,11 +788,56 @@ class Process:
 
         series -- a string of the series name.
         """
-        val_list = getattr(self, series, None)
-        if val_list is None:
-            val_list = []
-            setattr(self, series, val_list)
-        val_list.append(value)
+        self.column(series).append(value)
+
+    def add_sample(self, when, series, values):
+        """
+        Append one sample (a row of the log) to the process.
+
+        when -- the timestamp in seconds since the epoch.
+        series -- a list of series instance (see SeriesFilter).
+        values -- a list of transformed values, one per series.
+        """
+        self.time_series.append(when)
+        for s, value in zip(series, values):
+            self.column(s.name, s.typecode).append(value)
+
+    def extend(self, other):
+        """
+        Append all the samples of another Process instance of the
+        same process, eg, parsed from a later part of the log.
+        """
+        self.time_series.extend(other.time_series)
+        for name, col in other._series.iteritems():
+            self.column(name, col.typecode).extend(col)
+
+    def trim(self, since):
+        """
+        Drop the samples taken before a time.
+
+        since -- a time in seconds since the epoch.
+
+        Behaviour:
+            >>> p = Process("RBCWSSession(1234)", "test_log.txt")
+            >>> for when in [1000.0, 1005.0, 1010.0]:
+            ...     p.add_sample(when, [DefaultSeries("%ProcessorTime")],
+            ...             [when - 1000])
+            >>> p.trim(1005.0)
+            >>> p.time_series, p.get("%ProcessorTime")
+            (array('d', [1005.0, 1010.0]), array('d', [5.0, 10.0]))
+        """
+        i = bisect_left(self.time_series, since)
+        if i > 0:
+            del self.time_series[:i]
+            for col in self._series.itervalues():
+                del col[:i]
+
+    def envelope(self, series):
+        """
+        Return the (minimum, maximum) arrays of a series if the
+        samples have been folded together, None otherwise.
+        """
+        return None
 
     @staticmethod
     def compose_id(process_name_and_id, log_filename):
@@ -417,6 +848,518 @@ class Process:
         return "%s %s" % (process_name_and_id, log_filename)
 
 
+class DownsampledProcess(Process):
+    """
+    A process that folds its samples into at most 2 * resolution
+    time buckets while they are added, so its size depends on
+    the resolution of the chart instead of the length of the log.
+    For every bucket, the time series and the series hold the
+    mean, and envelope() gives the minimum and the maximum.
+
+    Buckets start 1 second wide.  Whenever there are more than
+    2 * resolution of them, neighbouring buckets are merged in
+    pairs and the bucket width is doubled.
+
+    Behaviour:
+        >>> s = DefaultSeries("%ProcessorTime")
+        >>> p = DownsampledProcess("RBCWSSession(1234)", "log.txt", 2)
+        >>> for i, value in enumerate([1, 5, 2, 8, 3, 4, 9, 0]):
+        ...     p.add_sample(1000 + i, [s], [value])
+        >>> p.bucket_width
+        2
+        >>> p.time_series
+        array('d', [1000.5, 1002.5, 1004.5, 1006.5])
+        >>> p.get("%ProcessorTime")
+        array('d', [3.0, 5.0, 3.5, 4.5])
+        >>> p.envelope("%ProcessorTime")
+        (array('d', [1.0, 2.0, 3.0, 0.0]), array('d', [5.0, 8.0, 4.0, 9.0]))
+    """
+
+    __slots__ = ("resolution", "bucket_width", "_zero", "_buckets",
+                 "_counts")
+
+    def __init__(self, process_name_and_id, log_filename, resolution):
+        """
+        resolution -- the number of points wanted on the chart.
+        """
+        Process.__init__(self, process_name_and_id, log_filename)
+        self.resolution     = resolution
+        self.bucket_width   = 1
+        self._zero          = None
+        self._buckets       = array("l")    # Bucket number of each bucket.
+        self._counts        = array("l")    # Samples folded in each bucket.
+
+    def add_sample(self, when, series, values):
+        self._add(when, 1, series, values, values, values)
+
+    def extend(self, other):
+        """
+        Fold in all the buckets of another DownsampledProcess.
+
+        Behaviour:
+            >>> s = DefaultSeries("%ProcessorTime")
+            >>> p = DownsampledProcess("RBCWSSession(1234)", "log.txt", 2)
+            >>> q = DownsampledProcess("RBCWSSession(1234)", "log.txt", 2)
+            >>> for i, value in enumerate([1, 5, 2, 8]):
+            ...     p.add_sample(1000 + i, [s], [value])
+            >>> for i, value in enumerate([3, 4, 9, 0]):
+            ...     q.add_sample(1004 + i, [s], [value])
+            >>> p.extend(q)
+            >>> p.get("%ProcessorTime")
+            array('d', [3.0, 5.0, 3.5, 4.5])
+        """
+        series = [DefaultSeries(name) for name in other._series
+                  if not name.endswith(" min") and not name.endswith(" max")]
+        for i, n in enumerate(other._counts):
+            means, lows, highs = [], [], []
+            for s in series:
+                low, high = other.envelope(s.name)
+                means.append(other.get(s.name)[i])
+                lows.append(low[i])
+                highs.append(high[i])
+            self._add(other.time_series[i], n, series, means, lows, highs)
+
+    def _add(self, when, n, series, means, lows, highs):
+        """
+        Fold n samples, with the given mean time and the given
+        mean, minimum and maximum of each series, into a bucket.
+        """
+        if self._zero is None:
+            self._zero = when
+        bucket = int((when - self._zero) // self.bucket_width)
+
+        # Samples come in time order, except around a DST change.
+        if len(self._buckets) > 0 and bucket == self._buckets[-1]:
+            i = len(self._buckets) - 1
+        else:
+            i = bisect_left(self._buckets, bucket)
+            if i == len(self._buckets) or self._buckets[i] != bucket:
+                self._insert_bucket(i, bucket, when, n, series,
+                        means, lows, highs)
+                if len(self._buckets) > 2 * self.resolution:
+                    self._merge_buckets()
+                return
+
+        total = self._counts[i] = self._counts[i] + n
+        self.time_series[i] += (when - self.time_series[i]) * n / total
+        for s, value, lowest, highest in zip(series, means, lows, highs):
+            mean = self._series[s.name]
+            mean[i] += (value - mean[i]) * n / total
+            low, high = self._envelope_columns(s.name)
+            if lowest < low[i]:
+                low[i] = lowest
+            if highest > high[i]:
+                high[i] = highest
+
+    def envelope(self, series):
+        return self._envelope_columns(series)
+
+    def _envelope_columns(self, series):
+        return (self._series[series + " min"], self._series[series + " max"])
+
+    def _insert_bucket(self, i, bucket, when, n, series, means, lows, highs):
+        self._buckets.insert(i, bucket)
+        self._counts.insert(i, n)
+        self.time_series.insert(i, when)
+        for k, s in enumerate(series):
+            self.column(s.name, s.typecode).insert(i, means[k])
+            self.column(s.name + " min", s.typecode).insert(i, lows[k])
+            self.column(s.name + " max", s.typecode).insert(i, highs[k])
+
+    def _merge_buckets(self):
+        """
+        Double the bucket width, merging neighbouring buckets.
+        """
+        self.bucket_width *= 2
+        buckets, counts = array("l"), array("l")
+        columns = {}
+        for name in self._series:
+            columns[name] = array(self._series[name].typecode)
+        time_series = array("d")
+
+        for i, bucket in enumerate(self._buckets):
+            bucket //= 2
+            n = self._counts[i]
+            if len(buckets) == 0 or buckets[-1] != bucket:
+                buckets.append(bucket)
+                counts.append(n)
+                time_series.append(self.time_series[i])
+                for name, col in columns.iteritems():
+                    col.append(self._series[name][i])
+                continue
+
+            total = counts[-1] + n
+            time_series[-1] += (self.time_series[i] - time_series[-1]) * n / total
+            for name, col in columns.iteritems():
+                value = self._series[name][i]
+                if name.endswith(" min"):
+                    col[-1] = min(col[-1], value)
+                elif name.endswith(" max"):
+                    col[-1] = max(col[-1], value)
+                else:
+                    col[-1] += (value - col[-1]) * n / total
+            counts[-1] = total
+
+        self._buckets, self._counts = buckets, counts
+        self.time_series, self._series = time_series, columns
+
+
+class QuantileSketch:
+    """
+    A streaming estimate of the quantiles of a series of values.
+    The values are counted in buckets whose bounds grow by a
+    constant factor, so any quantile is known within about
+    RELATIVE_ERROR of its true value, whatever the number of
+    values.  The buckets only depend on the range of the values
+    (about 1200 of them from 1 to 10^10), and sketches of parts of
+    a log are merged by adding up their counts.
+
+    Behaviour:
+        >>> q = QuantileSketch()
+        >>> q.add(numpy.arange(1, 1001.0))
+        >>> q.count
+        1000
+        >>> [round(q.quantile(p)) for p in (0.5, 0.95, 0.99)]
+        [498.0, 944.0, 983.0]
+        >>> r = QuantileSketch()
+        >>> r.add(numpy.array([0.0, -5.0] * 500))
+        >>> q.merge(r)
+        >>> [round(q.quantile(p)) for p in (0.25, 0.5, 0.75)]
+        [-5.0, 0.0, 498.0]
+    """
+
+    RELATIVE_ERROR = 0.01
+    GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+    LOG_GAMMA = log(GAMMA)
+
+    def __init__(self):
+        self.count = 0
+        self.zeros = 0
+        self.positive = {}  # Bucket key -> count, for values > 0.
+        self.negative = {}  # Bucket key -> count, for -values > 0.
+
+    def add(self, values):
+        """
+        Count the values of a NumPy array.
+        """
+        self.count += len(values)
+        self.zeros += int((values == 0).sum())
+        for buckets, magnitudes in ((self.positive, values[values > 0]),
+                                    (self.negative, -values[values < 0])):
+            if len(magnitudes) == 0:
+                continue
+            keys = numpy.ceil(numpy.log(magnitudes) / self.LOG_GAMMA)
+            keys = keys.astype(numpy.int64)
+            lowest = keys.min()
+            counts = numpy.bincount(keys - lowest)
+            for i in numpy.flatnonzero(counts):
+                key = int(lowest + i)
+                buckets[key] = buckets.get(key, 0) + int(counts[i])
+
+    def merge(self, other):
+        """
+        Count the values counted by another QuantileSketch.
+        """
+        self.count += other.count
+        self.zeros += other.zeros
+        for buckets, others in ((self.positive, other.positive),
+                                (self.negative, other.negative)):
+            for key, n in others.iteritems():
+                buckets[key] = buckets.get(key, 0) + n
+
+    def quantile(self, q):
+        """
+        Return the estimate of the q quantile (0 <= q <= 1), None
+        if no value was counted.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def _value(self, key):
+        # The middle of the bucket, within RELATIVE_ERROR of all of it.
+        return 2 * self.GAMMA ** key / (self.GAMMA + 1)
+
+
+class SeriesStats:
+    """
+    Summary statistics of a series of a process, computed a batch
+    of samples at a time in constant memory: the number of
+    samples, the first and last sample time, the minimum, maximum
+    and mean, the quantiles (see QuantileSketch), and the growth
+    rate, ie, the slope of the least squares line through the
+    samples, per hour.  The statistics of parts of a log are
+    merged with merge().
+
+    Behaviour:
+        >>> s = SeriesStats()
+        >>> hours = numpy.arange(0, 10 * 3600.0, 60)
+        >>> s.add(1000000000 + hours, 20 + 2.5 * hours / 3600)
+        >>> s.count, s.low, round(s.high, 2), round(s.mean(), 2)
+        (600, 20.0, 44.96, 32.48)
+        >>> round(s.growth_per_hour(), 6)
+        2.5
+        >>> round(s.quantile(0.5))
+        32.0
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.first = self.last = None
+        self.low = self.high = None
+        self.sketch = QuantileSketch()
+        # Sums for the least squares line, with the time measured
+        # from origin to keep them accurate.
+        self.origin = None
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+        self.sum_yy = 0.0
+
+    def add(self, times, values):
+        """
+        Add the samples of a series: NumPy arrays of the sample
+        times (seconds since the epoch) and of the values.
+        """
+        if len(times) == 0:
+            return
+        if self.origin is None:
+            self.origin = float(times[0])
+        t = times - self.origin
+        self.count += len(times)
+        self.sum_t += t.sum()
+        self.sum_y += values.sum()
+        self.sum_tt += (t * t).sum()
+        self.sum_ty += (t * values).sum()
+        self.sum_yy += (values * values).sum()
+        self.sketch.add(values)
+        self._bound(float(times.min()), float(times.max()),
+                float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        """
+        Add the samples summed up by another SeriesStats.
+        """
+        if other.count == 0:
+            return
+        if self.origin is None:
+            self.origin = other.origin
+        # Move the sums of other to the origin of self.
+        d = other.origin - self.origin
+        n = other.count
+        self.count += n
+        self.sum_tt += other.sum_tt + 2 * d * other.sum_t + n * d * d
+        self.sum_ty += other.sum_ty + d * other.sum_y
+        self.sum_t += other.sum_t + n * d
+        self.sum_y += other.sum_y
+        self.sum_yy += other.sum_yy
+        self.sketch.merge(other.sketch)
+        self._bound(other.first, other.last, other.low, other.high)
+
+    def _bound(self, first, last, low, high):
+        if self.first is None:
+            self.first, self.last, self.low, self.high = first, last, low, high
+        else:
+            self.first, self.last = min(self.first, first), max(self.last, last)
+            self.low, self.high = min(self.low, low), max(self.high, high)
+
+    def mean(self):
+        return self.sum_y / self.count
+
+    def quantile(self, q):
+        """
+        Return the estimate of the q quantile, within the minimum
+        and the maximum.
+        """
+        return min(max(self.sketch.quantile(q), self.low), self.high)
+
+    def growth_per_hour(self):
+        """
+        Return the slope of the least squares line through the
+        samples, per hour, or 0.0 if they are all at the same time.
+        """
+        stt, sty, syy = self.spreads()
+        if stt <= 0:
+            return 0.0
+        return sty / stt * 3600
+
+    def spreads(self):
+        """
+        Return the sums of the products of the deviations from
+        their means of the times and the values: (times by times,
+        times by values, values by values).  The least squares line
+        and its fit follow from them.
+        """
+        n = self.count
+        if n == 0:
+            return (0.0, 0.0, 0.0)
+        return (self.sum_tt - self.sum_t * self.sum_t / n,
+                self.sum_ty - self.sum_t * self.sum_y / n,
+                self.sum_yy - self.sum_y * self.sum_y / n)
+
+
+class SummaryProcess(Process):
+    """
+    A process that only keeps the summary statistics of each of
+    its series (see SeriesStats) instead of the samples, so its
+    size does not depend on the length of the logs.  Samples are
+    held in the columns of the Process until BATCH_SIZE of them
+    are there, then summed up all at once.
+
+    Behaviour:
+        >>> s = DefaultSeries("%ProcessorTime")
+        >>> p = SummaryProcess("RBCWSSession(1234)", "log.txt")
+        >>> for i, value in enumerate([1, 5, 2, 8]):
+        ...     p.add_sample(1000 + i, [s], [value])
+        >>> q = SummaryProcess("RBCWSSession(1234)", "log.txt")
+        >>> for i, value in enumerate([3, 4, 9, 0]):
+        ...     q.add_sample(1004 + i, [s], [value])
+        >>> p.extend(q)
+        >>> stats = p.stats["%ProcessorTime"]
+        >>> stats.count, stats.first, stats.last, stats.low, stats.high
+        (8, 1000.0, 1007.0, 0.0, 9.0)
+        >>> len(p.time_series)
+        0
+    """
+
+    __slots__ = ("stats",)
+
+    BATCH_SIZE = 4096
+
+    def __init__(self, process_name_and_id, log_filename):
+        Process.__init__(self, process_name_and_id, log_filename)
+        self.stats = {}     # Series name -> SeriesStats instance.
+
+    def add_sample(self, when, series, values):
+        Process.add_sample(self, when, series, values)
+        if len(self.time_series) >= self.BATCH_SIZE:
+            self.flush()
+
+    def extend(self, other):
+        """
+        Add all the samples of another Process instance, or the
+        statistics of another SummaryProcess.
+        """
+        if isinstance(other, SummaryProcess):
+            other.flush()
+        Process.extend(self, other)
+        self.flush()
+        if isinstance(other, SummaryProcess):
+            for name, stats in other.stats.iteritems():
+                self.stats.setdefault(name, SeriesStats()).merge(stats)
+
+    def flush(self):
+        """
+        Sum up the samples held in the columns, and empty them.
+        """
+        if len(self.time_series) == 0:
+            return
+        # The NumPy views are done with before the arrays are emptied.
+        times = as_ndarray(self.time_series)
+        for name, col in self._series.iteritems():
+            self.stats.setdefault(name, SeriesStats()).add(times,
+                    as_ndarray(col))
+            del col[:]
+        del self.time_series[:]
+
+
+# Openers of the compressed log files, by file extension.
+COMPRESSED_LOGS = {
+    ".gz": gzip.GzipFile,
+    ".bz2": bz2.BZ2File,
+}
+if lzma is not None:
+    COMPRESSED_LOGS[".xz"] = lzma.LZMAFile
+if zstandard is not None:
+    COMPRESSED_LOGS[".zst"] = lambda path: \
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+# Needs a module that may not be installed.
+OPTIONAL_COMPRESSED_LOGS = {".xz": "lzma", ".zst": "zstandard"}
+
+
+def is_compressed(path):
+    """
+    Return True if a log file is compressed (by its extension).
+
+    Behaviour:
+        >>> is_compressed("mon_all.txt.gz"), is_compressed("mon_all.txt")
+        (True, False)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    return ext in COMPRESSED_LOGS or ext in OPTIONAL_COMPRESSED_LOGS
+
+
+def open_compressed_log(path):
+    """
+    Return a file object reading a compressed log file decompressed.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in COMPRESSED_LOGS:
+        raise UsageError("Reading %s files needs the %s module!"
+                % (ext, OPTIONAL_COMPRESSED_LOGS[ext]))
+    return COMPRESSED_LOGS[ext](path)
+
+
+def read_ahead(log_file, size, depth=4):
+    """
+    Yield the blocks of up to size bytes of a file object, read by
+    a thread of its own, up to depth blocks ahead.  Decompression
+    releases the GIL, so a compressed log file is decompressed
+    while the blocks already read are parsed.
+
+    Behaviour:
+        >>> from StringIO import StringIO
+        >>> list(read_ahead(StringIO("0123456789"), 4))
+        ['0123', '4567', '89']
+    """
+    blocks = Queue.Queue(depth)
+    done = threading.Event()
+
+    def put(item):
+        while not done.isSet():
+            try:
+                blocks.put(item, True, 0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def read():
+        try:
+            while not done.isSet():
+                block = log_file.read(size)
+                put(block)
+                if not block:
+                    return
+        except Exception:
+            put(sys.exc_info())
+
+    reader = threading.Thread(target=read)
+    reader.setDaemon(True)
+    reader.start()
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, tuple):
+                raise block[0], block[1], block[2]
+            if not block:
+                return
+            yield block
+    finally:
+        done.set()
+        reader.join()
+
+
 class LogParser:
     r"""
     Parse mon_complus.vbs output log files.
@@ -463,23 +1406,48 @@ class LogParser:
         >>> len(session.time_series) == 3
         True
         >>> session.get("%ProcessorTime")
-        [23, 24, 25]
+        array('d', [23.0, 24.0, 25.0])
         >>> session.get("PrivateBytes")
-        [30.207999999999998, 25.071615999999999, 25.214976]
+        array('d', [30.208, 25.071616, 25.214976])
         >>> userinfo = processes[1]
         >>> userinfo.process_name
         'RBCWSUserInfo'
         >>> len(userinfo.time_series) == 1
         True
         >>> userinfo.get("%ProcessorTime")
-        [11]
+        array('d', [11.0])
         >>> userinfo.get("PrivateBytes")
-        [13.414400000000001]
+        array('d', [13.4144])
+        >>>
+        >>> # A last line still being written, here cut inside the
+        >>> # process name, is left for the next run, cache or not.
+        >>> log_file = open(log_path, 'a')
+        >>> log_file.write('4/4/2007 12:00:05 AM,.,RBCWSSes')
+        >>> log_file.close()
+        >>> from tempfile import mkdtemp
+        >>> import shutil
+        >>> cache = LogCache(mkdtemp())
+        >>> for c in [None, cache, cache]:
+        ...     parser = LogParser(pf, sf.fresh(), cache=c)
+        ...     [len(p.time_series) for p in parser.parse_logs(log_path)]
+        [3, 1]
+        [3, 1]
+        [3, 1]
+        >>> shutil.rmtree(cache.cache_dir)
         >>>
         >>> # Clean up.
         >>> os.remove(log_path)
     """
-    def __init__(self, process_filter, series_filter):
+    # With more than one job, a log file is split into chunks of at
+    # least this many bytes, and the chunks are parsed in parallel.
+    MIN_CHUNK_SIZE = 8 * 1024 * 1024
+
+    # A memory mapped log file is scanned this many bytes at a time.
+    SCAN_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, process_filter, series_filter, resolution=None,
+                 jobs=1, cache=None, summarize=False, since=None, until=None,
+                 profile=None):
         """
         process_filter -- a ProcessFilter instance that
                           is used to capture only those
@@ -489,99 +1457,1987 @@ class LogParser:
                          used to capture only those
                          series/metrics/columns that the
                          user is interested in.
+        resolution -- if not None, fold the samples of each
+                      process into about this many time buckets
+                      while parsing (see DownsampledProcess), so
+                      memory use does not grow with the logs.
+        jobs -- the number of worker processes parsing log
+                files (or chunks of a large log file) at the
+                same time.
+        cache -- if not None, a LogCache instance holding the
+                 logs parsed in earlier runs.  Not used with a
+                 resolution or summarize.
+        summarize -- if True, only keep the summary statistics of
+                     each process (see SummaryProcess) instead of
+                     its samples.  resolution is then ignored.
+        since, until -- if not None, only keep the samples taken
+                        from or until this time (in seconds since
+                        the epoch).  Only the part of a log file
+                        holding them is parsed, see TimeIndex.
+        profile -- if not None, a Profile instance recording the
+                   parsing of each log file.
 
         """
         self.process_filter = process_filter
         self.series_filter = series_filter
+        self.resolution = resolution
+        self.jobs = jobs
+        self.cache = cache
+        self.summarize = summarize
+        self.since = since
+        self.until = until
+        self.profile = profile
+        self.header = None
         self.are_headers_verified = False
+        self.timestamp_to_sec = TimestampParser()
+        self.counts = dict.fromkeys(Profile.COUNTS, 0)
+        # The ComputerName field of the first row parsed, if any.
+        self.computer_name = None
 
     def parse_logs(self, raw_paths):
         """
         Parse all mon_complus.vbs output log files given.
         Return a sorted process list with all the metrics.
 
-        raw_paths -- a string of output log files separated by comma.
+        raw_paths -- a string of output log files (or folders of
+                     a LogExport) separated by comma.
         """
-        paths = [os.path.abspath(p) for p in raw_paths.split(",")]
-        processes = {}
-
-        # We parse every log file here.
-        for path in paths:
+        paths = []
+        for path in [os.path.abspath(p) for p in raw_paths.split(",")]:
             if not os.path.exists(path):
                 print "<%s> does not exist!" % path
                 continue
+            paths.append(path)
 
-            partial = self._get_processes_in_log(path)
-            processes.update(partial)
-
-        # Sort it in proper order for easy viewing.
-        return sorted(processes.values(),
-                key=lambda p: "%s %s %s" % (
-                p.process_name, p.log_filename, p.process_id))
+        # We parse every log file here, and load every export.
+        processes = {}
+        logs = [path for path in paths if not LogExport.is_export(path)]
+        if self.profile is None:
+            for partial in self._parse_each_log(logs):
+                processes.update(partial)
+        else:
+            # One log file at a time, to tell what each one costs.
+            for path in logs:
+                record = self.profile.start(
+                        "parse %s" % os.path.basename(path), self.counts)
+                partial = self._parse_each_log([path])[0]
+                self.profile.stop(record, partial.values())
+                processes.update(partial)
+        for path in paths:
+            if LogExport.is_export(path):
+                if self.profile is not None:
+                    record = self.profile.start(
+                            "load %s" % os.path.basename(path), self.counts)
+                partial = self._load_export(path)
+                if self.profile is not None:
+                    self.profile.stop(record, partial.values())
+                processes.update(partial)
+
+        # Sort it in proper order for easy viewing.
+        return sorted(processes.values(), key=process_sort_key)
+
+    def _parse_each_log(self, paths, ends=None):
+        """
+        Return a list of dict of processes, one per log file,
+        in the order of the paths.
+
+        A partial line at the end of a log file, still being
+        written, is left out, to be parsed on the next run.
+
+        With a cache, a log file is parsed in full, ie, all its
+        processes and columns, and saved to the cache.  As log
+        files only ever grow (mon_complus.vbs keeps appending to
+        them), a log file that was cached before is parsed from
+        where the cached part ends, and the cache is updated.  The
+        processes and series we are interested in are then picked
+        out of the cached ones.  The cache is not used with a
+        resolution or summarize, which keep memory bounded by
+        folding the rows as they are parsed.
+
+        ends -- if not None, the byte offsets, one per log file, at
+                the end of a line, up to which the log files are
+                parsed.  By default, the end of their last complete
+                line, see _complete_size().
+        """
+        if ends is None:
+            ends = [self._complete_size(path) for path in paths]
+
+        if self.since is not None or self.until is not None:
+            ranges = []
+            for path, complete in zip(paths, ends):
+                path, start, end = self._time_range(path)
+                if end is None or end > complete:
+                    end = complete
+                ranges.append((path, min(start, end), end))
+            return self._parse_ranges(ranges)
+
+        if self.cache is None or self.resolution is not None or \
+                self.summarize:
+            return self._parse_ranges([(path, 0, complete)
+                                       for path, complete in zip(paths, ends)])
+
+        # For each log file: the range of complete lines not cached yet.
+        states = []
+        ranges = []
+        for path, complete in zip(paths, ends):
+            state = self.cache.load(path)
+            if state is None:
+                state = (None, {}, 0)
+            if complete < state[2]:
+                state = (None, {}, 0)   # Should not happen, but play safe.
+            elif is_compressed(path) and complete != state[2]:
+                state = (None, {}, 0)   # Cannot be read from the middle.
+            states.append(state)
+            ranges.append((path, state[2], complete))
+
+        parser = LogParser(AllProcesses(), AllSeries(), jobs=self.jobs)
+        parsed = parser._parse_ranges(ranges)
+        self._add_counts(parser.counts)
+        if self.computer_name is None:
+            self.computer_name = parser.computer_name
+
+        results = []
+        for i, path in enumerate(paths):
+            header, processes, offset = states[i]
+            complete = ranges[i][2]
+            if header is None:
+                header = parser._read_header(path)
+            if complete > offset or offset == 0:
+                self._merge(processes, parsed[i])
+                self.cache.save(path, header, processes, complete)
+            results.append(self._select(header, processes))
+        return results
+
+    def _time_range(self, path):
+        """
+        Return the (path, start, end) range of the part of a log
+        file holding the samples from self.since until self.until,
+        with the TimeIndex of the log file (cached, if possible).
+        """
+        if is_compressed(path):
+            return (path, 0, None)  # Cannot be read from the middle.
+
+        index = None
+        if self.cache is not None:
+            index = self.cache.load_index(path)
+        if index is None:
+            index = TimeIndex()
+        if index.update(path, self.timestamp_to_sec) and \
+                self.cache is not None:
+            self.cache.save_index(path, index)
+        start, end = index.range(self.since, self.until)
+        return (path, start, end)
+
+    def _load_export(self, path):
+        """
+        Return a dict of the processes we are interested in, with
+        the series we are interested in, out of a LogExport.
+        """
+        export = LogExport(path)
+        header = export.header()
+        self._verify_header(header)
+        names = []
+        for s in self.series_filter.series:
+            names.extend(s.column_names())
+        return self._select(*export.load(self.process_filter, names,
+                self.since, self.until))
+
+    def _merge(self, processes, later):
+        """
+        Append the processes parsed from a later part of a log file
+        (a dict of Process instance) to those of an earlier part.
+        """
+        for id, p in later.iteritems():
+            if id in processes:
+                processes[id].extend(p)
+            else:
+                processes[id] = p
+
+    def _complete_size(self, path):
+        """
+        Return the size of a log file up to the end of its last
+        complete line, ie, leaving out a line still being written.
+        A compressed log file is taken as complete.
+        """
+        if is_compressed(path):
+            return os.path.getsize(path)
+
+        log_file = open(path, "rb")
+        try:
+            end = os.path.getsize(path)
+            while end > 0:
+                start = max(0, end - self.SCAN_BLOCK_SIZE)
+                log_file.seek(start)
+                i = log_file.read(end - start).rfind("\n")
+                if i >= 0:
+                    return start + i + 1
+                end = start
+            return 0
+        finally:
+            log_file.close()
+
+    def _select(self, header, processes):
+        """
+        Return a dict of the processes we are interested in, with
+        the series we are interested in, out of the processes with
+        all the (untransformed) columns of a log file.
+
+        header -- the header of the log file, None if it has none.
+        processes -- a dict of Process instance, see AllSeries.
+        """
+        self._verify_header(header)
+
+        selected = {}
+        for id, full in processes.iteritems():
+            if full.process_name_and_id not in self.process_filter:
+                continue
+
+            p = Process(full.process_name_and_id, full.log_filename)
+            p.time_series = full.time_series
+            columns = []
+            for s in self.series_filter.series:
+                names = s.column_names()
+                if [n for n in names if n not in full._series]:
+                    continue
+                p._series[s.name] = s.transform_columns(
+                        [full.get(n) for n in names])
+                columns.append(s)
+
+            if self.summarize:
+                summary = self._new_process(p.process_name_and_id,
+                        p.log_filename)
+                summary.extend(p)
+                p = summary
+            elif self.resolution is not None:
+                folded = self._new_process(p.process_name_and_id,
+                        p.log_filename)
+                for i, when in enumerate(p.time_series):
+                    folded.add_sample(when, columns,
+                            [p.get(s.name)[i] for s in columns])
+                p = folded
+            selected[id] = p
+
+        return selected
+
+    def _parse_ranges(self, ranges):
+        """
+        Return a list of dict of processes, one per range of a log
+        file, in the order of the ranges.  With more than one job,
+        the ranges are split into chunks, which are parsed in a
+        pool of self.jobs worker processes.
+
+        ranges -- a list of (path, start, end) tuple, where start
+                  and end are byte offsets at the start of a line
+                  (end is None for the end of the file).
+        """
+        if self.jobs <= 1:
+            partials = []
+            for path, start, end in ranges:
+                if start > 0 and not self.are_headers_verified:
+                    self._verify_header(self._read_header(path))
+                partials.append(self._get_processes_in_log(path, start, end))
+            return partials
+
+        # The header is taken from the start of each log here, so
+        # the series filter is initialized only once, and every chunk
+        # of a log uses the header of its log.
+        tasks = []
+        owners = []
+        for i, (path, start, end) in enumerate(ranges):
+            header = self._read_header(path)
+            self._verify_header(header)
+
+            offsets = self._chunk_offsets(path, start, end)
+            for chunk_start, chunk_end in zip(offsets[:-1], offsets[1:]):
+                tasks.append((self.process_filter, self.series_filter.fresh(),
+                    self.resolution, self.summarize, self.since, self.until,
+                    header, path, chunk_start, chunk_end))
+                owners.append(i)
+
+        if len(tasks) <= 1:
+            results = [_parse_chunk_in_worker(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(min(self.jobs, len(tasks)))
+            try:
+                results = pool.map(_parse_chunk_in_worker, tasks)
+            finally:
+                pool.terminate()
+
+        # Stitch the chunks of each range back together in time order.
+        partials = [{} for r in ranges]
+        for i, (partial, counts) in zip(owners, results):
+            self._merge(partials[i], partial)
+            self._add_counts(counts)
+        return partials
+
+    def _add_counts(self, counts):
+        """
+        Add the counts (see Profile.COUNTS) of another LogParser.
+        """
+        for name, count in counts.iteritems():
+            self.counts[name] += count
+
+    def _chunk_offsets(self, path, start=0, end=None):
+        """
+        Return the byte offsets splitting a range of a log file into
+        at most self.jobs chunks, each starting at the start of a
+        line.  The first offset is start and the last one is end
+        (the file size if None).  No chunk is returned for an empty
+        range.
+        """
+        if end is None:
+            end = os.path.getsize(path)
+        if start >= end:
+            return [start]
+        if is_compressed(path):
+            return [start, end]     # Cannot be read from the middle.
+
+        size = end - start
+        count = max(1, min(self.jobs, size // self.MIN_CHUNK_SIZE))
+        offsets = [start]
+        log_file = open(path, "rb")
+        try:
+            for i in range(1, count):
+                log_file.seek(start + size * i // count)
+                log_file.readline()  # Skip to the start of the next line.
+                offset = log_file.tell()
+                if offsets[-1] < offset < end:
+                    offsets.append(offset)
+        finally:
+            log_file.close()
+        offsets.append(end)
+        return offsets
+
+    def _verify_header(self, header):
+        """
+        Initialize the series filter with a header, unless it has
+        been initialized already.  We only care about the header
+        line from the first log file, assuming all log files would
+        have the same columns.
+
+        header -- a list of column names, or None.
+        """
+        if header is not None and not self.are_headers_verified:
+            self.series_filter.initialize(header)
+            self.header = header
+            self.are_headers_verified = True
+
+    def _read_header(self, path):
+        """
+        Return the header of a log file, as a list of column
+        names, or None if there is none in its first chunk.
+        """
+        end = min(os.path.getsize(path), self.MIN_CHUNK_SIZE)
+        for line in self._wanted_lines(path, 0, end):
+            fields = line.split(",")
+            if fields[0] == "Time":
+                return fields
+        return None
 
-    def _get_processes_in_log(self, path):
+    def _get_processes_in_log(self, path, start=0, end=None):
         """
-        Return the processes in a log file as a dict.
+        Return the processes in a log file (or in the chunk of it
+        between the start and end byte offsets) as a dict.
         """
         processes = {}
         filename = os.path.basename(path)
-        log_file = csv.reader(open(path, "r"))
+        series = self.series_filter.series
+
+        # The same few hundred ProcessName(ID) fields repeat on
+        # millions of rows: map each of them to its Process once.
+        by_name = {}
+        lines = self._wanted_lines(path, start, end)
+        for name_n_id, when, values in self._samples(lines):
+            try:
+                p = by_name[name_n_id]
+            except KeyError:
+                name_n_id = intern(name_n_id)
+                p = self._new_process(name_n_id, filename)
+                by_name[name_n_id] = processes[p.id] = p
+            p.add_sample(when, series, values)
+
+        return processes
+
+    def _new_process(self, name_n_id, filename):
+        if self.summarize:
+            return SummaryProcess(name_n_id, filename)
+        if self.resolution is None:
+            return Process(name_n_id, filename)
+        return DownsampledProcess(name_n_id, filename, self.resolution)
+
+    def _wanted_lines(self, path, start=0, end=None):
+        """
+        Yield the header lines, and the lines of the processes we are
+        interested in, of a log file from the start byte offset up to
+        the end byte offset (or the end of the file).
+
+        The log file is memory mapped and scanned a block at a time.
+        Only the first 3 fields of a line are split out before the
+        process filter is asked, and the numeric fields are only
+        split for the wanted lines, so the lines of the processes
+        we are not interested in cost next to nothing.
+
+        A compressed log file (see is_compressed) is decompressed
+        as it is scanned, and can only be read as a whole: a range
+        starting past its start is empty.
+        """
+        if is_compressed(path):
+            if start == 0:
+                for wanted in self._decompressed_lines(path):
+                    yield wanted
+            return
+
+        log_file = open(path, "rb")
+        try:
+            try:
+                buf = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError, OverflowError):
+                # An empty file, or one too large to map into the
+                # address space: scan it line by line instead.
+                log_file.seek(start)
+                position = start
+                for line in iter(log_file.readline, ""):
+                    for wanted in self._scan(line, 0, len(line)):
+                        yield wanted
+                    position += len(line)
+                    if end is not None and position >= end:
+                        break
+                return
+
+            try:
+                if end is None:
+                    end = len(buf)
+                for wanted in self._scan(buf, start, end):
+                    yield wanted
+            finally:
+                buf.close()
+        finally:
+            log_file.close()
+
+    def _decompressed_lines(self, path):
+        """
+        Yield the wanted lines (see _wanted_lines) of a compressed
+        log file, decompressed a block at a time in another thread.
+        """
+        log_file = open_compressed_log(path)
+        try:
+            rest = ""
+            for block in read_ahead(log_file, self.SCAN_BLOCK_SIZE):
+                block = rest + block
+                stop = block.rfind("\n") + 1
+                for wanted in self._scan(block, 0, stop):
+                    yield wanted
+                rest = block[stop:]
+            for wanted in self._scan(rest, 0, len(rest)):
+                yield wanted
+        finally:
+            log_file.close()
+
+    def _scan(self, buf, pos, end):
+        """
+        Yield the wanted lines (see _wanted_lines) starting between
+        the pos and end offsets of a buffer (a string or a mmap),
+        without their line ending.
+        """
+        process_filter = self.process_filter
+        counts = self.counts
+        while pos < end:
+            # Slice out a block of whole lines at a time.
+            stop = buf.find("\n", min(pos + self.SCAN_BLOCK_SIZE, end) - 1) + 1
+            if stop == 0:
+                stop = len(buf)
+
+            lines = buf[pos:stop].split("\n")
+            for line in lines:
+                # Split off the first 3 fields only: Time, Computer
+                # Name, Process Name.  The rest stays in one piece.
+                fields = line.split(",", 3)
+                if len(fields) < 3 or len(fields[0]) == 0:
+                    # Only record the stat if time is not empty!
+                    continue
+                if fields[2].rstrip("\r") in process_filter or \
+                        fields[0] == "Time":
+                    yield line.rstrip("\r")
+
+            # Counted once all its lines are consumed, so a block only
+            # peeked at, eg, for the header, is not.
+            counts["rows_scanned"] += len(lines) - (lines[-1] == "")
+            counts["bytes_read"] += stop - pos
+            pos = stop
+
+    def _samples(self, lines):
+        """
+        Yield a (name_n_id, time, values) tuple for each row of
+        a process we are interested in, where time is in seconds
+        since the epoch and values are transformed according to
+        the series filter.  The lines are consumed lazily, so only
+        one line is in memory at a time.
+
+        lines -- an iterable of wanted lines (see _wanted_lines).
+        """
+        since, until = self.since, self.until
+        series = self.series_filter.series
+        matched = 0
+        try:
+            for line in lines:
+                fields = line.split(",")
+                if fields[0] == "Time":
+                    self._verify_header(fields)
+                    continue
+                matched += 1
+                if matched == 1 and self.computer_name is None:
+                    self.computer_name = fields[1]
+                when = self.timestamp_to_sec(fields[0])
+                if (since is not None and when < since) or \
+                        (until is not None and when > until):
+                    continue
+                yield (fields[2], when, [s.parse(fields) for s in series])
+        finally:
+            self.counts["rows_matched"] += matched
+
+
+def process_sort_key(p):
+    """
+    The key to sort processes in proper order for easy viewing.
+    """
+    return "%s %s %s" % (p.process_name, p.log_filename, p.process_id)
+
+
+def _parse_chunk_in_worker(task):
+    """
+    Parse a chunk of a log file in a worker process of the pool
+    used by LogParser.  Return the dict of processes found in it,
+    and the counts (see Profile.COUNTS) of the parsing.
+
+    task -- a (process_filter, series_filter, resolution, summarize,
+            since, until, header, path, start, end) tuple, see
+            LogParser.
+    """
+    process_filter, series_filter, resolution, summarize = task[:4]
+    since, until, header, path, start, end = task[4:]
+    parser = LogParser(process_filter, series_filter, resolution,
+            summarize=summarize, since=since, until=until)
+    parser._verify_header(header)
+    return parser._get_processes_in_log(path, start, end), parser.counts
+
+
+class LogFollower:
+    """
+    Keep up with log files that are still being written (eg, by
+    mon_complus.vbs), parsing only the lines appended to them since
+    the last poll.  A line still being written is left for the next
+    poll.  With a cache (see LogParser), the first poll of a log
+    file only parses what has been appended since it was cached.
+
+    Behaviour:
+        >>> from tempfile import mkstemp
+        >>> sf = SeriesFilter([("%ProcessorTime", "DefaultSeries")])
+        >>> fd, log_path = mkstemp()
+        >>> log_file = os.fdopen(fd, 'w')
+        >>> log_file.write("Time,CN,PN(ID),%ProcessorTime\\n"
+        ...         "4/3/2007 10:00:37 AM,.,RBCWSSession(6520),23\\n"
+        ...         "4/3/2007 10:00:42 AM,.,RBCWSSes")
+        >>> log_file.flush()
+        >>> follower = LogFollower(LogParser(AllProcesses(), sf), [log_path])
+        >>> [p.get("%ProcessorTime") for p in follower.poll()]
+        [array('d', [23.0])]
+        >>> log_file.write("sion(6520),24\\n")
+        >>> log_file.close()
+        >>> [p.get("%ProcessorTime") for p in follower.poll()]
+        [array('d', [23.0, 24.0])]
+        >>> follower.poll()
+        []
+        >>> os.remove(log_path)
+    """
+    def __init__(self, parser, paths, window=None):
+        """
+        parser -- a LogParser instance.
+        paths -- a list of log file paths.
+        window -- if not None, only keep the samples of the last
+                  this many seconds (of each log file).
+        """
+        self.parser = parser
+        self.paths = paths
+        self.window = window
+        self.offsets = dict([(path, 0) for path in paths])
+        self.processes = {}
+
+        # Get the series from the headers up front, to lay out a graph.
+        for path in paths:
+            if os.path.exists(path):
+                parser._verify_header(parser._read_header(path))
+
+    def poll(self):
+        """
+        Parse what has been appended to the log files.  Return the
+        list of processes with new samples.
+        """
+        ranges = []
+        cached = []     # First polled log files, parsed with the cache.
+        for path in self.paths:
+            if not os.path.exists(path):
+                continue
+            complete = self.parser._complete_size(path)
+            if complete < self.offsets[path]:
+                # The log file was started over: follow the new one.
+                self.offsets[path] = 0
+                for id, p in self.processes.items():
+                    if p.log_filename == os.path.basename(path):
+                        del self.processes[id]
+            if complete > self.offsets[path]:
+                if self.offsets[path] == 0 and self.parser.cache is not None:
+                    cached.append((path, complete))
+                else:
+                    ranges.append((path, self.offsets[path], complete))
+                self.offsets[path] = complete
+
+        partials = self.parser._parse_ranges(ranges)
+        if cached:
+            partials.extend(self.parser._parse_each_log(
+                    [c[0] for c in cached], [c[1] for c in cached]))
+
+        updated = {}
+        for partial in partials:
+            self.parser._merge(self.processes, partial)
+            for id in partial:
+                updated[id] = self.processes[id]
+
+        if self.window is not None:
+            for p in updated.itervalues():
+                p.trim(p.time_series[-1] - self.window)
+
+        return sorted(updated.values(), key=process_sort_key)
+
+
+class Farm:
+    """
+    The series of each application (ie, process name) on each host
+    of a server farm, resampled on a common grid of step seconds
+    (see resample()).  Only the resampled series are kept: the
+    processes of a log file are dropped once added, so the logs of
+    hundreds of hosts take little memory.
+
+    Behaviour:
+        >>> s = DefaultSeries("%ProcessorTime")
+        >>> farm = Farm(60)
+        >>> for host, values in [("web01", [10, 30]), ("web02", [50, 70])]:
+        ...     p = Process("dllhost(%d)" % len(host), "mon.txt")
+        ...     p.add_sample(1175608800.0, [s], [values[0]])
+        ...     p.add_sample(1175608930.0, [s], [values[1]])
+        ...     farm.add(host, [p], [s])
+        >>> for p in farm.processes():
+        ...     p.id, list(p.get("%ProcessorTime"))
+        ('dllhost(web01) farm', [10.0, nan, 30.0])
+        ('dllhost(web02) farm', [50.0, nan, 70.0])
+        >>> [(p.id, list(p.get("%ProcessorTime")))
+        ...  for p in farm.processes("max")]
+        [('dllhost(max of 2 hosts) farm', [50.0, nan, 70.0])]
+    """
+    AGGREGATES = ("sum", "mean", "max")
+
+    def __init__(self, step):
+        """
+        step -- the seconds between two points of the grid.
+        """
+        self.step = step
+        # (host, application, series name) -> (slots, values, counts).
+        self.series = {}
+
+    def add(self, host, processes, series):
+        """
+        Resample the series of the processes of a host, and add them.
+        The processes of an application running at the same time, eg,
+        several svchost, are summed up slot by slot, so an application
+        takes the memory of all its instances.
+
+        processes -- a list of Process instance, eg, of a log file.
+        series -- a list of series instance, see SeriesFilter.
+
+        Behaviour:
+            >>> s = DefaultSeries("PrivateBytes")
+            >>> farm = Farm(60)
+            >>> processes = []
+            >>> for pid, values in [(1, [10, 30]), (2, [5, 5])]:
+            ...     p = Process("svchost(%d)" % pid, "mon.txt")
+            ...     p.add_sample(1175608800.0, [s], [values[0]])
+            ...     p.add_sample(1175608930.0, [s], [values[1]])
+            ...     processes.append(p)
+            >>> farm.add("web01", processes, [s])
+            >>> [(p.id, list(p.get("PrivateBytes"))) for p in farm.processes()]
+            [('svchost(web01) farm', [15.0, nan, 35.0])]
+        """
+        parts = {}
+        for p in processes:
+            times = as_ndarray(p.time_series)
+            for s in series:
+                if s.name in p._series:
+                    key = (host, p.process_name, s.name)
+                    parts.setdefault(key, []).append(
+                            resample(times, as_ndarray(p.get(s.name)),
+                                     self.step))
+        for key, resampled in parts.iteritems():
+            if len(resampled) > 1:
+                parts[key] = [reduce_slots(
+                        numpy.concatenate([r[0] for r in resampled]),
+                        numpy.concatenate([r[1] for r in resampled]),
+                        "sum")]
+        self.merge(parts)
+
+    def merge(self, parts):
+        """
+        Add resampled series, eg, from another Farm.
+
+        parts -- a dict of (host, application, series name) to a list
+                 of (slots, values, counts), see resample().
+        """
+        for key, resampled in parts.iteritems():
+            if key in self.series:
+                resampled = resampled + [self.series[key]]
+            if len(resampled) > 1:
+                resampled = [reduce_slots(
+                        numpy.concatenate([r[0] for r in resampled]),
+                        numpy.concatenate([r[1] for r in resampled]),
+                        "mean",
+                        numpy.concatenate([r[2] for r in resampled]))]
+            self.series[key] = resampled[0]
+
+    def processes(self, aggregate=None):
+        """
+        Return a sorted list of Process instance: one per host and
+        application, named Application(Host), or, with an aggregate
+        (see AGGREGATES), one per application of the aggregate of
+        its series across hosts, named Application(max of N hosts).
+
+        The time series of all start on the first point of the
+        grid, so their elapsed times line up, and a series has a
+        NaN, ie, a break in its line, where a host has no sample.
+        """
+        if not self.series:
+            return []
+        start = min([r[0][0] for r in self.series.itervalues()])
+
+        groups = {}
+        for (host, application, name), resampled in self.series.iteritems():
+            if aggregate is None:
+                key = "%s(%s)" % (application, host)
+            else:
+                key = application
+            groups.setdefault(key, {}).setdefault(name, {})[host] = resampled
+
+        processes = []
+        for key, by_name in groups.iteritems():
+            columns = {}
+            for name, by_host in by_name.iteritems():
+                if aggregate is None:
+                    columns[name] = by_host.values()[0][:2]
+                else:
+                    columns[name] = reduce_slots(
+                            numpy.concatenate([r[0] for r in
+                                               by_host.itervalues()]),
+                            numpy.concatenate([r[1] for r in
+                                               by_host.itervalues()]),
+                            aggregate)[:2]
+            if aggregate is not None:
+                hosts = set()
+                for by_host in by_name.itervalues():
+                    hosts.update(by_host.keys())
+                key = "%s(%s of %d hosts)" % (key, aggregate, len(hosts))
+            processes.append(grid_process(key, "farm", columns, start,
+                                          self.step))
+        return sorted(processes, key=process_sort_key)
+
+
+def host_of_log(path, computer_name, host_folder=None):
+    """
+    Return the host a log file was written on: its ComputerName
+    field, unless mon_complus.vbs monitored the local computer (.),
+    then the folder of the host holding the log file, if any, or
+    else the name of the log file, eg, one log file per host.
+
+    host_folder -- the folder of the host, see farm_log_paths().
+
+    Behaviour:
+        >>> host_of_log("/logs/mon.txt", "WEB01")
+        'WEB01'
+        >>> host_of_log("/logs/web01.txt.gz", ".")
+        'web01'
+        >>> host_of_log("/farm/web01/2007/mon.txt", ".", "/farm/web01")
+        'web01'
+    """
+    if computer_name and computer_name != ".":
+        return computer_name
+    if host_folder is not None:
+        return os.path.basename(host_folder)
+    name = os.path.basename(path)
+    if is_compressed(name):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[0]
+
+
+def farm_log_paths(raw_paths):
+    """
+    Return the log files of a farm, in order, as a list of (path,
+    host folder): the log files given, and the files in the folders
+    given.  The files in a subfolder of a folder given are of a host
+    each, named after the subfolder (see host_of_log()), eg, a folder
+    of the logs of each host.  The host folder of the other files is
+    None.
+
+    raw_paths -- a string of log files or folders separated by comma.
+
+    Behaviour:
+        >>> from tempfile import mkdtemp
+        >>> import shutil
+        >>> farm = mkdtemp()
+        >>> for host in ["web01", "web02"]:
+        ...     os.mkdir(os.path.join(farm, host))
+        ...     open(os.path.join(farm, host, "mon.txt"), "w").close()
+        >>> [(path[len(farm):], host_of_log(path, ".", folder))
+        ...  for path, folder in farm_log_paths(farm)]
+        [('/web01/mon.txt', 'web01'), ('/web02/mon.txt', 'web02')]
+        >>> shutil.rmtree(farm)
+    """
+    paths = []
+    for path in [os.path.abspath(p) for p in raw_paths.split(",")]:
+        if not os.path.isdir(path):
+            paths.append((path, None))
+            continue
+        if LogExport.is_export(path):
+            raise UsageError("%s is an export, not a log file!" % path)
+        for folder, dirs, files in os.walk(path):
+            dirs.sort()
+            host_folder = None
+            if folder != path:
+                host = folder[len(path):].lstrip(os.sep).split(os.sep)[0]
+                host_folder = os.path.join(path, host)
+            paths.extend([(os.path.join(folder, name), host_folder)
+                          for name in sorted(files)
+                          if not name.startswith(".")])
+    for path, host_folder in paths:
+        if not os.path.isfile(path):
+            raise UsageError("<%s> does not exist!" % path)
+    if not paths:
+        raise UsageError("No log files found!")
+    return paths
+
+
+def parse_farm(paths, process_filter, series_filter, step, jobs=1,
+               cache=None, since=None, until=None, profile=None):
+    """
+    Parse the log files of a server farm into a Farm.  Each log
+    file is parsed on its own, on up to jobs worker processes at the
+    same time, and only its resampled series are kept.
+
+    Two log files may only be of the same host if both name it in
+    their ComputerName field, or both are in the folder of the host:
+    log files of different folders named alike, eg, web01/mon.txt
+    and web02/mon.txt, are not taken for the same host.
+
+    paths -- a list of (path, host folder), see farm_log_paths(),
+             of any number of hosts.
+    series_filter -- a SeriesFilter instance, initialized with the
+                     header of the first log file.
+    Other arguments -- see LogParser.
+    """
+    first = paths[0][0]
+    checker = LogParser(process_filter, series_filter)
+    checker._verify_header(checker._read_header(first))
+    if not checker.are_headers_verified:
+        raise UsageError("No header found in %s!" % first)
+
+    tasks = [(process_filter, series_filter.fresh(), step, cache, since,
+              until, None, path, host_folder) for path, host_folder in paths]
+    farm = Farm(step)
+    sources = {}    # Host -> the folder or log file it was named after.
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            parts, counts, host, source = _farm_log_in_worker(
+                    task[:6] + (profile,) + task[7:])
+            _check_host_source(sources, host, source)
+            farm.merge(parts)
+        return farm
+
+    counts = dict.fromkeys(Profile.COUNTS, 0)
+    if profile is not None:
+        record = profile.start("parse %d logs" % len(paths), counts)
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        # As they come, so only a few results are held at a time.
+        for parts, log_counts, host, source in pool.imap_unordered(
+                _farm_log_in_worker, tasks):
+            _check_host_source(sources, host, source)
+            farm.merge(parts)
+            for name, count in log_counts.iteritems():
+                counts[name] += count
+    finally:
+        pool.terminate()
+    if profile is not None:
+        profile.stop(record)
+    return farm
+
+
+def _check_host_source(sources, host, source):
+    """
+    Raise a UsageError if a host was named after another folder or
+    log file before (see parse_farm()).
+
+    sources -- a dict of host to the folder or log file it was named
+               after, None if named by the ComputerName field.
+    """
+    if host is None:
+        return
+    if host in sources and sources[host] != source:
+        raise UsageError("Both <%s> and <%s> are taken for host %s! Please"
+                " put the log files of each host in a folder of its own."
+                % (sources[host] or host, source or host, host))
+    sources[host] = source
+
+
+def _farm_log_in_worker(task):
+    """
+    Parse a log file of a farm, in a worker process of the pool
+    used by parse_farm().  Return its resampled series, see
+    Farm.merge(), the counts (see Profile.COUNTS) of the parsing,
+    its host (None without any process of interest), and the folder
+    or log file the host is named after (None if named by the
+    ComputerName field).
+
+    task -- a (process_filter, series_filter, step, cache, since,
+            until, profile, path, host folder) tuple, see parse_farm().
+    """
+    process_filter, series_filter, step, cache, since, until = task[:6]
+    profile, path, host_folder = task[6:]
+    parser = LogParser(process_filter, series_filter, cache=cache,
+            since=since, until=until, profile=profile)
+    processes = parser.parse_logs(path)
+    if not processes:
+        return {}, parser.counts, None, None
+
+    computer_name = parser.computer_name
+    if computer_name is None:
+        # Nothing parsed, ie, all cached: the first row will do.
+        rows = LogParser(AllProcesses(), AllSeries())._wanted_lines(path)
+        for line in rows:
+            fields = line.split(",")
+            if fields[0] != "Time":
+                computer_name = fields[1]
+                break
+        rows.close()
+
+    host = host_of_log(path, computer_name, host_folder)
+    source = None
+    if not computer_name or computer_name == ".":
+        source = host_folder or path
+    farm = Farm(step)
+    farm.add(host, processes, series_filter.series)
+    return dict([(key, [resampled]) for key, resampled in
+                 farm.series.iteritems()]), parser.counts, host, source
+
+
+def _array_from_string(typecode, data):
+    column = array(typecode)
+    column.fromstring(data)
+    return column
+
+
+def _reduce_array(column):
+    """
+    Pickle an array.array as its raw bytes, instead of as a list
+    of Python numbers (Python 2's default), to keep the LogCache
+    files and the results of worker processes compact and quick
+    to load.
+
+    Behaviour:
+        >>> column = array("d", [1.5, 2.5])
+        >>> cPickle.loads(cPickle.dumps(column, 2))
+        array('d', [1.5, 2.5])
+    """
+    return _array_from_string, (column.typecode, column.tostring())
+
+copy_reg.pickle(array, _reduce_array)
+
+
+class LogCache:
+    """
+    An on-disk cache of parsed log files, so the same logs are
+    not parsed again on every run.  A cache file holds every
+    process and every column of one log file, in the array.array
+    columns of Process, pickled, along with the byte offset up to
+    which the log file was parsed.  The TimeIndex of a log file
+    is cached the same way, in a cache file of its own.
+
+    A cache file stays valid as long as the size and the mtime of
+    its log file are the same.  Log files only ever grow, so once
+    a log file has grown, its cache file is still valid if the
+    digest of its head, and of the part just before the cached
+    offset, are the same; the caller then parses only what has been
+    appended since.  A log file changed without growing is parsed
+    again.  When the cache grows over max_size, the least recently
+    used cache files are removed.
+
+    Behaviour:
+        >>> from tempfile import mkdtemp, mkstemp
+        >>> import shutil
+        >>> cache = LogCache(mkdtemp())
+        >>> fd, log_path = mkstemp()
+        >>> log_file = os.fdopen(fd, 'w')
+        >>> log_file.write("Time,CN,PN(ID),PrivateBytes\\n")
+        >>> log_file.close()
+        >>> cache.load(log_path) is None
+        True
+        >>> p = Process("RBCWSSession(6520)", os.path.basename(log_path))
+        >>> p.add_sample(1000.0, [DefaultSeries("PrivateBytes")], [30208000])
+        >>> cache.save(log_path, ["Time", "CN", "PN(ID)", "PrivateBytes"],
+        ...         {p.id: p}, 28)
+        >>> header, processes, offset = cache.load(log_path)
+        >>> header, offset
+        (['Time', 'CN', 'PN(ID)', 'PrivateBytes'], 28)
+        >>> processes[p.id].get("PrivateBytes")
+        array('d', [30208000.0])
+        >>>
+        >>> # Appending to the log file keeps its cache.
+        >>> log_file = open(log_path, 'a')
+        >>> log_file.write("4/3/2007 10:00:37 AM,.,RBCWSSession(6520),0\\n")
+        >>> log_file.close()
+        >>> cache.load(log_path)[2]
+        28
+        >>>
+        >>> # Editing it in place, to the same size, does not.
+        >>> cache.save(log_path, ["Time", "CN", "PN(ID)", "PrivateBytes"],
+        ...         {p.id: p}, 72)
+        >>> log_file = open(log_path, 'r+')
+        >>> log_file.seek(70)
+        >>> log_file.write("9")
+        >>> log_file.close()
+        >>> os.utime(log_path, (0, 0))
+        >>> cache.load(log_path) is None
+        True
+        >>>
+        >>> # Nor does rewriting it.
+        >>> log_file = open(log_path, 'w')
+        >>> log_file.write("Time,CN,PN(ID),WorkingSet\\n")
+        >>> log_file.close()
+        >>> cache.load(log_path) is None
+        True
+        >>>
+        >>> # Clean up.
+        >>> os.remove(log_path)
+        >>> shutil.rmtree(cache.cache_dir)
+    """
+
+    # Bump this when the layout of a cache file changes.
+    VERSION = 3
+    EXT = ".cache"
+    INDEX_EXT = ".index"    # The cache files of TimeIndex instances.
+    # Bytes of a log file in its digest, from its start, and from
+    # just before the cached offset.
+    HEAD_SIZE = 64 * 1024
+
+    def __init__(self, cache_dir, max_size=1024 * 1024 * 1024):
+        """
+        cache_dir -- the folder holding the cache files, created
+                     if it does not exist.
+        max_size -- the maximum total size (in bytes) of the
+                    cache files.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def load(self, path):
+        """
+        Return the (header, processes, offset) tuple cached for a
+        log file, or None if it is not cached or has been changed,
+        other than appended to, since.
+        """
+        cached = self._load(path, self.EXT)
+        if cached is None:
+            return None
+        offset, (header, processes) = cached
+        return header, processes, offset
+
+    def save(self, path, header, processes, offset):
+        """
+        Cache the header and the processes (a dict of Process
+        instance) of a log file, parsed up to the offset.
+        """
+        self._save(path, self.EXT, (header, processes), offset)
+
+    def load_index(self, path):
+        """
+        Return the TimeIndex cached for a log file, or None.
+        """
+        cached = self._load(path, self.INDEX_EXT)
+        if cached is None:
+            return None
+        return cached[1]
+
+    def save_index(self, path, index):
+        self._save(path, self.INDEX_EXT, index, index.size)
+
+    def _load(self, path, ext):
+        """
+        Return the (offset, data) tuple of the cache file of a log
+        file with the extension ext, or None if there is none or
+        the log file has been changed, other than appended to, since.
+        """
+        cache_path = self._cache_path(path, ext)
+        try:
+            cache_file = open(cache_path, "rb")
+        except EnvironmentError:
+            return None
+
+        try:
+            try:
+                version, cached_path, offset, size, mtime, digest = \
+                        cPickle.load(cache_file)
+                if (version, cached_path) != (self.VERSION, path):
+                    return None
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime) != (size, mtime):
+                    # Changed: it must have grown, and only grown.
+                    if stat.st_size <= size or \
+                            self._digest(path, offset) != digest:
+                        return None
+                data = cPickle.load(cache_file)
+            except Exception:
+                # Unreadable or outdated cache file: parse the log again.
+                return None
+        finally:
+            cache_file.close()
+
+        # Mark it as recently used.
+        os.utime(cache_path, None)
+        return offset, data
+
+    def _save(self, path, ext, data, offset):
+        """
+        Write the cache file of a log file with the extension ext,
+        holding data about the log file up to the offset.
+        """
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+
+            # Write to a temporary file first, so an interrupted run
+            # never leaves a truncated cache file behind.
+            fd, temp_path = mkstemp(suffix=".tmp", dir=self.cache_dir)
+            cache_file = os.fdopen(fd, "wb")
+            try:
+                stat = os.stat(path)
+                info = (self.VERSION, path, offset, stat.st_size,
+                        stat.st_mtime, self._digest(path, offset))
+                cPickle.dump(info, cache_file, 2)
+                cPickle.dump(data, cache_file, 2)
+            finally:
+                cache_file.close()
+
+            cache_path = self._cache_path(path, ext)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            os.rename(temp_path, cache_path)
+        except EnvironmentError, err:
+            print >> sys.stderr, "Cannot cache <%s>: %s" % (path, err)
+            return
+
+        self._evict()
+
+    def _digest(self, path, offset):
+        """
+        Return the digest of the part of a log file before the
+        offset, taken from up to HEAD_SIZE bytes at its start, and
+        up to HEAD_SIZE bytes just before the offset.
+        """
+        log_file = open(path, "rb")
+        try:
+            digest = md5(log_file.read(min(offset, self.HEAD_SIZE)))
+            tail = max(self.HEAD_SIZE, offset - self.HEAD_SIZE)
+            if tail < offset:
+                log_file.seek(tail)
+                digest.update(log_file.read(offset - tail))
+            return digest.hexdigest()
+        finally:
+            log_file.close()
+
+    def _cache_path(self, path, ext):
+        name = md5(os.path.normcase(path)).hexdigest()
+        return os.path.join(self.cache_dir, name + ext)
+
+    def _evict(self):
+        """
+        Remove the least recently used cache files until the cache
+        is no larger than max_size.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.EXT) and \
+                    not name.endswith(self.INDEX_EXT):
+                continue
+            cache_path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(cache_path)
+            except EnvironmentError:
+                continue    # Evicted by another run at the same time.
+            entries.append((stat.st_mtime, stat.st_size, cache_path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, cache_path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(cache_path)
+            except EnvironmentError:
+                pass
+            total -= size
+
+
+class TimeIndex:
+    """
+    A sparse index of the times of a log file: the offset and the
+    time of the first sample line at or after every SPACING bytes.
+    It tells which part of a log file holds the samples of a time
+    range without parsing the log file, and only a line every
+    SPACING bytes is read to build it, or to extend it as the log
+    file grows.
+
+    Log files are written in time order, except that the clock goes
+    back an hour when daylight saving time ends.  When the times of
+    the index are not in order, the part of the log file returned
+    is widened by SLACK seconds on both sides to make up for it.
+
+    Behaviour:
+        >>> from tempfile import mkstemp
+        >>> fd, log_path = mkstemp()
+        >>> def write_log(mode, first, last):
+        ...     log_file = open(log_path, mode)
+        ...     for minute in range(first, last):
+        ...         log_file.write("4/3/2007 %d:%02d:00 AM,.,System(4),1\\n"
+        ...                        % (10 + minute // 60, minute % 60))
+        ...     log_file.close()
+        >>> os.close(fd)
+        >>> log_file = open(log_path, 'w')
+        >>> log_file.write("Time,CN,PN(ID),PrivateBytes\\n")
+        >>> log_file.close()
+        >>> write_log('a', 0, 100)
+        >>> index = TimeIndex()
+        >>> index.SPACING = 400     # About every 10 lines.
+        >>> index.update(log_path, timestamp_to_sec)
+        True
+        >>> len(index.offsets), index.size
+        (9, 3528)
+
+    The part of the log file from 10:20 to 10:30, to the next
+    offset indexed on both sides:
+        >>> def first_times(start, end):
+        ...     log = open(log_path).read()
+        ...     return log[start:].split(",")[0], log[end:].split(",")[0]
+        >>> ten = timestamp_to_sec("4/3/2007 10:00:00 AM")
+        >>> first_times(*index.range(ten + 20 * 60, ten + 30 * 60))
+        ('4/3/2007 10:11:00 AM', '4/3/2007 10:34:00 AM')
+
+    The clock going back an hour widens the range:
+        >>> write_log('a', 40, 100)
+        >>> index.update(log_path, timestamp_to_sec)
+        True
+        >>> first_times(*index.range(ten + 20 * 60, ten + 30 * 60))
+        ('Time', '4/3/2007 11:31:00 AM')
+        >>>
+        >>> # Clean up.
+        >>> os.remove(log_path)
+    """
+
+    SPACING = 256 * 1024
+    SLACK = 3600
+
+    def __init__(self):
+        self.offsets = array("d")   # Byte offsets of lines...
+        self.times = array("d")     # ... and their times.
+        self.size = 0               # Bytes of the log file indexed.
+        self.boundary = 0           # Offset of the next line to index.
+
+    def update(self, path, timestamp_to_sec):
+        """
+        Index the complete lines appended to a log file since the
+        last update.  Return True if the index has changed.
+
+        timestamp_to_sec -- a function converting the time field
+                            of a line into seconds since the epoch.
+        """
+        size = os.path.getsize(path)
+        if size <= self.size:
+            return False
+
+        log_file = open(path, "rb")
+        try:
+            while self.boundary < size:
+                log_file.seek(max(0, self.boundary - 1))
+                if self.boundary > 0:
+                    log_file.readline()     # The rest of the line before.
+                offset = log_file.tell()
+                line = log_file.readline()
+                # Skip the header, and the lines without a time, as
+                # LogParser does.
+                while line.endswith("\n"):
+                    fields = line.split(",", 3)
+                    if len(fields) >= 3 and fields[0] and \
+                            fields[0] != "Time":
+                        break
+                    offset += len(line)
+                    line = log_file.readline()
+                if not line.endswith("\n"):
+                    break   # Only a line still being written is left.
+                if len(self.offsets) == 0 or offset > self.offsets[-1]:
+                    self.offsets.append(offset)
+                    self.times.append(timestamp_to_sec(fields[0]))
+                self.boundary += self.SPACING
+            self.size = size
+        finally:
+            log_file.close()
+        return True
+
+    def range(self, since=None, until=None):
+        """
+        Return the (start, end) byte offsets of the part of the log
+        file holding the samples from the time since until the time
+        until (seconds since the epoch, None for no limit).  end
+        is None for the end of the log file.
+        """
+        times = list(self.times)
+        slack = 0
+        for i in xrange(1, len(times)):
+            if times[i] < times[i - 1]:
+                slack = self.SLACK
+                break
+
+        start, end = 0, None
+        if since is not None:
+            # The lines before an offset are at most slack later
+            # than the lines after it.
+            lowest = times[:]
+            for i in xrange(len(lowest) - 2, -1, -1):
+                lowest[i] = min(lowest[i], lowest[i + 1])
+            i = bisect_left(lowest, since - slack)
+            if i > 0:
+                start = int(self.offsets[i - 1])
+        if until is not None:
+            highest = times[:]
+            for i in xrange(1, len(highest)):
+                highest[i] = max(highest[i], highest[i - 1])
+            i = bisect_right(highest, until + slack)
+            if i < len(highest):
+                end = int(self.offsets[i])
+        return start, end
+
+
+class LogExport:
+    """
+    A folder holding parsed log files column by column, in NumPy
+    .npy files that other tools (and plot_complus.py, see
+    LogParser) load without parsing the logs again:
+        columns.npy -- the header of the logs.
+        processes.npy -- the index of the processes: a record
+                         array of their ProcessName(ID), the name
+                         of their log file, and the start and stop
+                         rows of their samples in the columns.
+        NN_<name>.npy -- a column, ie, the Time column (seconds
+                         since the epoch) then every column from
+                         the 4th one of the header, NN being its
+                         position in the header.
+    A column is stored in the narrowest integer type holding all
+    its values, or as float64 if they are not all whole numbers.
+    Loading maps the files into memory, so only the rows and
+    columns asked for are read.
+
+    Behaviour:
+        >>> from tempfile import mkdtemp
+        >>> import shutil
+        >>> header = ["Time", "CN", "PN(ID)", "%ProcessorTime", "IO/sec"]
+        >>> s = AllSeries()
+        >>> s.initialize(header)
+        >>> p = Process("RBCWSSession(6520)", "log.txt")
+        >>> q = Process("System(4)", "log.txt")
+        >>> for i in range(3):
+        ...     p.add_sample(1175608800.0 + i, s.series, [10 * i, 0.5])
+        ...     q.add_sample(1175608800.0 + i, s.series, [i, 2.5])
+        >>> export = LogExport(os.path.join(mkdtemp(), "export"))
+        >>> export.save(header, {p.id: p, q.id: q})
+        >>> sorted(os.listdir(export.path))
+        ['00_Time.npy', '03_%ProcessorTime.npy', '04_IO_sec.npy', 'columns.npy', 'processes.npy']
+        >>> LogExport.is_export(export.path)
+        True
+        >>> header, processes = export.load(ProcessFilter("system"),
+        ...                                 ["IO/sec"])
+        >>> header[-1], processes.keys()
+        ('IO/sec', ['System(4) log.txt'])
+        >>> q = processes['System(4) log.txt']
+        >>> q.time_series
+        array('d', [1175608800.0, 1175608801.0, 1175608802.0])
+        >>> q.get("IO/sec")
+        array('d', [2.5, 2.5, 2.5])
+        >>> "%ProcessorTime" in q._series
+        False
+        >>> numpy.load(os.path.join(export.path, "03_%ProcessorTime.npy")).dtype
+        dtype('int8')
+        >>>
+        >>> # Clean up.
+        >>> shutil.rmtree(os.path.dirname(export.path))
+    """
+
+    COLUMNS = "columns.npy"
+    INDEX = "processes.npy"
+
+    def __init__(self, path):
+        """
+        path -- the folder of the export.
+        """
+        self.path = path
+
+    def is_export(path):
+        """
+        Return True if path is the folder of a LogExport.
+        """
+        return os.path.isfile(os.path.join(path, LogExport.INDEX))
+    is_export = staticmethod(is_export)
+
+    def save(self, header, processes):
+        """
+        Save processes, replacing any export already in the folder.
+
+        header -- the header of the log files.
+        processes -- a dict of Process instance, with all the
+                     (untransformed) columns of header, see AllSeries.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for filename in os.listdir(self.path):
+            if filename.endswith(".npy"):
+                os.remove(os.path.join(self.path, filename))
+
+        ordered = sorted(processes.values(), key=process_sort_key)
+        index = numpy.zeros(len(ordered), dtype=[
+                ("process", "S%d" % max([1] + [len(p.process_name_and_id)
+                                               for p in ordered])),
+                ("log", "S%d" % max([1] + [len(p.log_filename)
+                                           for p in ordered])),
+                ("start", numpy.int64), ("stop", numpy.int64)])
+        rows = 0
+        for i, p in enumerate(ordered):
+            index[i] = (p.process_name_and_id, p.log_filename,
+                        rows, rows + len(p.time_series))
+            rows += len(p.time_series)
+
+        for position, name in self._columns(header):
+            if position == 0:
+                parts = [p.time_series for p in ordered]
+            else:
+                parts = [p.get(name) for p in ordered]
+            column = numpy.lib.format.open_memmap(
+                    self._column_path(position, name), mode="w+",
+                    dtype=self._narrowest(parts), shape=(rows,))
+            for (start, stop), part in zip(index[["start", "stop"]], parts):
+                if len(part) == stop - start:
+                    column[start:stop] = as_ndarray(part)
+                else:
+                    column[start:stop] = 0  # Not in the log of the process.
+            del column
+
+        numpy.save(os.path.join(self.path, self.COLUMNS), numpy.array(header))
+        numpy.save(os.path.join(self.path, self.INDEX), index)
+
+    def load(self, process_filter, names, since=None, until=None):
+        """
+        Return (header, processes), processes being a dict of
+        Process instance of the processes in process_filter, with
+        the time series and the (untransformed) columns in names.
+
+        since, until -- if not None, only load the samples taken
+                        from or until this time.
+        """
+        header = self.header()
+        index = numpy.load(os.path.join(self.path, self.INDEX))
+        columns = []
+        for position, name in self._columns(header):
+            if position == 0 or name in names:
+                columns.append((name, numpy.load(
+                        self._column_path(position, name), mmap_mode="r")))
+
+        processes = {}
+        for name_n_id, log_filename, start, stop in index:
+            if name_n_id not in process_filter:
+                continue
+            p = Process(name_n_id, log_filename)
+            rows = slice(start, stop)
+            if since is not None or until is not None:
+                times = columns[0][1][start:stop]
+                wanted = numpy.ones(len(times), dtype=bool)
+                if since is not None:
+                    wanted &= times >= since
+                if until is not None:
+                    wanted &= times <= until
+                rows = start + numpy.flatnonzero(wanted)
+            for position, (name, column) in enumerate(columns):
+                part = array("d", column[rows].astype(
+                        numpy.float64).tostring())
+                if position == 0:
+                    p.time_series = part
+                else:
+                    p._series[name] = part
+            if len(p.time_series) > 0:
+                processes[p.id] = p
+        return header, processes
+
+    def header(self):
+        return [str(name) for name in
+                numpy.load(os.path.join(self.path, self.COLUMNS))]
+
+    def _columns(self, header):
+        """
+        Return the (position, name) of the columns stored.
+        """
+        return [(0, header[0])] + [(i, header[i])
+                                   for i in range(3, len(header))]
+
+    def _column_path(self, position, name):
+        return os.path.join(self.path, "%02d_%s.npy" % (position,
+                re.sub(r"[^\w%.()-]", "_", name)))
+
+    def _narrowest(self, parts):
+        """
+        Return the narrowest NumPy type holding all values of
+        the columns in parts.
+        """
+        low, high = 0, 0
+        for part in parts:
+            values = as_ndarray(part)
+            if len(values) == 0:
+                continue
+            if not (numpy.floor(values) == values).all():
+                return numpy.float64
+            low, high = min(low, values.min()), max(high, values.max())
+        for dtype in (numpy.int8, numpy.int16, numpy.int32, numpy.int64):
+            if numpy.iinfo(dtype).min <= low and high <= numpy.iinfo(dtype).max:
+                return dtype
+        return numpy.float64
+
+
+def timestamp_to_sec(timestamp):
+    """
+    Convert a timestamp string from the log into seconds
+    since the epoch (local time).
+
+    Behaviour:
+        >>> midnight = timestamp_to_sec('4/4/2007 12:00:00 AM')
+        >>> midnight == timestamp_to_sec('4/4/2007')
+        True
+    """
+    try:
+        return mktime(strptime(timestamp, "%m/%d/%Y %I:%M:%S %p"))
+    except ValueError:
+        # If the time is on the dot (00:00:00),
+        # only date will be shown.
+        return mktime(strptime(timestamp, "%m/%d/%Y"))
+
+
+def time_option_to_sec(text):
+    """
+    Convert the time given to an option (--from or --to) into
+    seconds since the epoch (local time).  It is either in the
+    format of the log, or YYYY-MM-DD [HH:MM[:SS]].
+
+    Behaviour:
+        >>> two = time_option_to_sec("2007-04-03 14:00")
+        >>> two == timestamp_to_sec("4/3/2007 2:00:00 PM")
+        True
+        >>> time_option_to_sec("2007-04-03") == timestamp_to_sec("4/3/2007")
+        True
+        >>> time_option_to_sec("teatime")
+        Traceback (most recent call last):
+        UsageError: Invalid time: teatime
+    """
+    for format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return mktime(strptime(text, format))
+        except ValueError:
+            pass
+    try:
+        return timestamp_to_sec(text)
+    except ValueError:
+        raise UsageError("Invalid time: %s" % text)
+
+
+class TimestampParser:
+    """
+    A fast replacement of timestamp_to_sec() for whole columns of
+    timestamps.  mon_complus.vbs writes its timestamps in a fixed
+    layout ("M/D/YYYY H:MM:SS AM"), and a log only ever spans a
+    handful of distinct hours, so the epoch value of the top of
+    each hour is computed once with strptime/mktime and cached;
+    every other timestamp costs a few string splits and integer
+    conversions.  Anything not in the fixed layout (such as the
+    date-only timestamps written on the dot at midnight) goes
+    through timestamp_to_sec(), so the results are identical.
+
+    Behaviour:
+        >>> parse = TimestampParser()
+        >>> column = ['4/3/2007 10:00:37 AM', '4/3/2007 12:00:00 PM',
+        ... '4/3/2007 11:59:57 PM', '4/4/2007', '4/4/2007 12:00:02 AM']
+        >>> expected = [timestamp_to_sec(t) for t in column]
+        >>> [parse(t) for t in column] == expected
+        True
+        >>> parse.convert(column) == array("d", map(timestamp_to_sec, column))
+        True
+        >>> parse("4/31/2007 10:00:00 AM")
+        Traceback (most recent call last):
+        ...
+        ValueError: day is out of range for month
+        >>> parse("4/3/2007 10:75:99 AM")
+        Traceback (most recent call last):
+        ...
+        ValueError: unconverted data remains:  10:75:99 AM
+        >>> parse("4/3/2007 13:00:00 AM")
+        Traceback (most recent call last):
+        ...
+        ValueError: unconverted data remains:  13:00:00 AM
+    """
+    def __init__(self):
+        self._hour_cache = {}
+
+    def __call__(self, timestamp):
+        """
+        Return the timestamp in seconds since the epoch.
+        """
+        try:
+            date, clock, am_pm = timestamp.split(" ")
+            hour, minute, second = clock.split(":")
+            base = self._hour_cache[date, hour, am_pm]
+        except KeyError:
+            if not (hour.isdigit() and 1 <= int(hour) <= 12):
+                # Out of range: raise the ValueError of strptime().
+                return timestamp_to_sec(timestamp)
+            base = self._hour_base(date, hour, am_pm)
+        except ValueError:
+            return timestamp_to_sec(timestamp)
+        minute, second = int(minute), int(second)
+        if not (0 <= minute <= 59 and 0 <= second <= 61):
+            return timestamp_to_sec(timestamp)
+        return base + minute * 60 + second
+
+    def convert(self, column):
+        """
+        Convert a whole column of timestamps in one pass.
+        Return an array of float of seconds since the epoch.
+
+        column -- an iterable of timestamp strings.
+        """
+        return array("d", map(self, column))
+
+    def _hour_base(self, date, hour, am_pm):
+        """
+        Compute and cache the epoch value of the top of an hour.
+        """
+        t = strptime("%s %s:00:00 %s" % (date, hour, am_pm),
+                "%m/%d/%Y %I:%M:%S %p")
+        base = self._hour_cache[date, hour, am_pm] = mktime(t)
+        return base
+
+
+def make_time_series(series):
+    """
+    Make a elapsed time series by converting from
+    a timestamp series.  Return an array of float of
+    elapsed time in minutes.
+
+    series -- a sequence of timestamp in seconds since the epoch
+
+    Behaviour:
+        >>> time_series = [timestamp_to_sec(t) for t in [
+        ... '4/3/2007 10:00:37 AM',
+        ... '4/3/2007 12:00:00 PM',
+        ... '4/3/2007 11:59:57 PM',
+        ... '4/4/2007',
+        ... ]]
+        >>> from plot_complus import make_time_series
+        >>> make_time_series(time_series)
+        array('d', [0.0, 119.38333333333334, 839.3333333333334, 839.3833333333333])
+    """
+    zero = series[0]
+    return array("d", [(t - zero) / 60 for t in series])
+
+
+def as_ndarray(column):
+    """
+    Return a NumPy view of a float array.array column
+    without copying the samples.
+    """
+    return numpy.frombuffer(column, dtype=numpy.float64)
+
+
+def downsample(x, y, buckets):
+    """
+    Reduce a line to the minimum and the maximum of each of a number
+    of buckets of consecutive points, in their original order.  With
+    a bucket per pixel column of the axes, the line looks the same
+    (spikes included), but the time to draw it and the size of a
+    saved .svg or .pdf no longer depend on the number of samples.
+    Return the (x, y) arrays of the points kept.
+
+    x, y -- NumPy arrays of the line.
+    buckets -- the number of buckets.
+
+    Behaviour:
+        >>> x = numpy.arange(12.0)
+        >>> y = numpy.array([5, 1, 9, 5, 5, 5, 0, 5, 5, 7, 5, 6.0])
+        >>> dx, dy = downsample(x, y, 3)
+        >>> dx.tolist()
+        [0.0, 1.0, 2.0, 4.0, 6.0, 8.0, 9.0, 11.0]
+        >>> dy.tolist()
+        [5.0, 1.0, 9.0, 5.0, 0.0, 5.0, 7.0, 6.0]
+
+    Short lines are left alone:
+        >>> len(downsample(x, y, 6)[0])
+        12
+    """
+    n = len(x)
+    if n <= 2 * buckets:
+        return x, y
+
+    size = -(-n // buckets)     # Points per bucket, rounded up.
+    m = n // size * size
+    starts = numpy.arange(0, m, size)
+    rows = y[:m].reshape(-1, size)
+    keep = numpy.concatenate((
+        [0],
+        starts + rows.argmin(axis=1),
+        starts + rows.argmax(axis=1),
+        numpy.arange(m, n),     # The last, partial bucket as it is.
+        [n - 1]))
+    keep = numpy.unique(keep)
+    return x[keep], y[keep]
+
+
+def reduce_slots(slots, values, how="mean", weights=None):
+    """
+    Reduce the values sharing a slot of a time grid into one.
+    Return (slots, values, weights): the sorted distinct slots, the
+    reduced value of each, and the total weight of each.
+
+    slots -- a NumPy array of slot numbers, in any order.
+    values -- a NumPy array of values, one per slot number.
+    how -- "mean" (weighted by weights), "sum", "max" or "last",
+           ie, the last value of the slot in the given order.
+    weights -- a NumPy array of weights, one per value, or None
+               for a weight of 1 each.
+
+    Behaviour:
+        >>> slots = numpy.array([3, 1, 3, 1, 2])
+        >>> values = numpy.array([1.0, 2.0, 3.0, 4.0, 5.0])
+        >>> reduce_slots(slots, values)
+        (array([1, 2, 3]), array([3., 5., 2.]), array([2., 1., 2.]))
+        >>> reduce_slots(slots, values, "max")[1]
+        array([4., 5., 3.])
+        >>> reduce_slots(slots, values, "last")[1]
+        array([4., 5., 3.])
+        >>> reduce_slots(slots, values, "mean", numpy.array([1, 3, 1, 1, 1]))[1]
+        array([2.5, 5. , 2. ])
+    """
+    if weights is None:
+        weights = numpy.ones(len(values))
+    order = numpy.argsort(slots, kind="mergesort")
+    slots, values = slots[order], values[order]
+    weights = numpy.asarray(weights, dtype=numpy.float64)[order]
+    if len(slots) == 0:
+        return slots, values, weights
+    starts = numpy.flatnonzero(numpy.concatenate(([True],
+                                                  slots[1:] != slots[:-1])))
+    total = numpy.add.reduceat(weights, starts)
+    if how == "max":
+        reduced = numpy.maximum.reduceat(values, starts)
+    elif how == "last":
+        reduced = values[numpy.concatenate((starts[1:], [len(values)])) - 1]
+    elif how == "sum":
+        reduced = numpy.add.reduceat(values, starts)
+    else:
+        reduced = numpy.add.reduceat(values * weights, starts) / total
+    return slots[starts], reduced, total
+
+
+def resample(times, values, step, how="mean"):
+    """
+    Put samples on a grid of step seconds, aligned on the clock, ie,
+    slot n holds the samples taken from n * step to (n + 1) * step
+    seconds since the epoch.  Return (slots, values, counts), see
+    reduce_slots().
+
+    Behaviour:
+        >>> times = numpy.array([0.0, 5.0, 65.0, 130.0, 175.0])
+        >>> resample(times, numpy.array([1.0, 3.0, 5.0, 7.0, 9.0]), 60)
+        (array([0, 1, 2]), array([2., 5., 8.]), array([2., 1., 2.]))
+    """
+    slots = numpy.floor(numpy.asarray(times) / step).astype(numpy.int64)
+    return reduce_slots(slots, numpy.asarray(values, dtype=numpy.float64),
+                        how)
+
+
+def grid_process(name_n_id, log_filename, columns, start, step, fill=False):
+    """
+    Return a Process with columns resampled on a grid (see
+    resample()).  Its time series starts on the start slot of the
+    grid, so processes on the same grid line up, and a column has a
+    NaN, ie, a break in its line, where it has no sample.
+
+    columns -- a dict of series name to (slots, values).
+    start -- the first slot of the grid.
+    step -- the seconds between two slots.
+    fill -- if True, every slot after the first sample of a
+            column holds the value of the sample before, instead.
+
+    Behaviour:
+        >>> columns = {"%ProcessorTime": (numpy.array([1, 3]),
+        ...                               numpy.array([5.0, 7.0]))}
+        >>> p = grid_process("App(1)", "log.txt", columns, 0, 60)
+        >>> p.time_series, p.get("%ProcessorTime")
+        (array('d', [0.0, 60.0, 120.0, 180.0]), array('d', [nan, 5.0, nan, 7.0]))
+        >>> p = grid_process("App(1)", "log.txt", columns, 0, 60, fill=True)
+        >>> p.get("%ProcessorTime")
+        array('d', [nan, 5.0, 5.0, 7.0])
+    """
+    slots = numpy.unique(numpy.concatenate([c[0] for c in
+                                            columns.itervalues()]))
+    if fill:
+        slots = numpy.arange(min(start, slots[0]), slots[-1] + 1)
+    else:
+        # A NaN at the start of the grid, and after each gap.
+        breaks = slots[numpy.flatnonzero(numpy.diff(slots) > 1)] + 1
+        if slots[0] > start:
+            breaks = numpy.concatenate(([start], breaks))
+        slots = numpy.union1d(slots, breaks)
+
+    p = Process(name_n_id, log_filename)
+    p.time_series.fromstring(
+            (slots * float(step)).astype(numpy.float64).tostring())
+    for name, (column_slots, values) in columns.iteritems():
+        column = numpy.empty(len(slots))
+        column.fill(numpy.nan)
+        positions = numpy.searchsorted(slots, column_slots)
+        column[positions] = values
+        if fill:
+            # The position of the last sample so far, at each slot.
+            last = numpy.zeros(len(slots), dtype=numpy.int64)
+            last[positions] = positions
+            column = column[numpy.maximum.accumulate(last)]
+        p.column(name).fromstring(column.tostring())
+    return p
+
+
+RESAMPLE_METHODS = ("ffill", "mean", "max")
+ALIGNMENTS = ("elapsed", "clock")
+
+
+def resample_processes(processes, step, how="mean", align="elapsed"):
+    """
+    Return the processes resampled on a uniform grid of step seconds,
+    eg, to compare runs sampled with a jitter.
+
+    how -- "mean" or "max" of the samples of a slot, or "ffill" for
+           the last sample of a slot, carried forward over the slots
+           without any (see RESAMPLE_METHODS).
+    align -- "elapsed" for a grid starting at the first sample of
+             each process, or "clock" for a grid on the clock,
+             starting at the first sample of all (see ALIGNMENTS).
 
-        for line in log_file:
-            if len(line) < 3:
-                # An empty line or not all column presents so we skip it.
-                pass
-            elif line[0] == "Time":
-                # We only care about the header line from the first log
-                # file, assuming all log files would have the same columns.
-                if not self.are_headers_verified:
-                    self.series_filter.initialize(line)
-                    self.are_headers_verified = True
-            else:
-                name_n_id = line[2]
-                if name_n_id in self.process_filter:
-                    id = Process.compose_id(name_n_id, filename)
-                    p = processes.setdefault(id, Process(name_n_id, filename))
-
-                    time = line[0]
-                    if len(time) > 0:
-                        # Only record the stat if time is not empty!
-                        p.time_series.append(time)
-                        for s in self.series_filter.series:
-                            p.set(s.name, s.transform(line[s.index]))
+    Behaviour:
+        >>> s = DefaultSeries("%ProcessorTime")
+        >>> p = Process("App(1)", "log1.txt")
+        >>> for when, value in [(1000.0, 1), (1004.0, 3), (1013.0, 8)]:
+        ...     p.add_sample(when, [s], [value])
+        >>> q = resample_processes([p], 5)[0]
+        >>> q.time_series, q.get("%ProcessorTime")
+        (array('d', [0.0, 5.0, 10.0]), array('d', [2.0, nan, 8.0]))
+    """
+    processes = [p for p in processes if len(p.time_series) > 0]
+    if align == "clock" and processes:
+        start = int(min([p.time_series[0] for p in processes]) // step)
+    else:
+        start = 0
+    if how == "ffill":
+        reduction = "last"
+    else:
+        reduction = how
 
-        return processes
+    resampled = []
+    for p in processes:
+        times = as_ndarray(p.time_series)
+        if align == "elapsed":
+            times = times - times[0]
+        columns = {}
+        for name in p._series:
+            columns[name] = resample(times, as_ndarray(p.get(name)), step,
+                                     reduction)[:2]
+        resampled.append(grid_process(p.process_name_and_id,
+                p.log_filename, columns, start, step, how == "ffill"))
+    return resampled
 
 
-def make_time_series(series):
+def diff_processes(processes, log_filenames, step, how="mean",
+                   align="elapsed"):
     """
-    Make a elapsed time series by converting from
-    a timestamp series.  Return a list of float of
-    elapsed time in minutes.
+    Return, for each process name found in two log files, a process
+    of its series in the second log file minus those in the first,
+    eg, to compare the runs before and after a deployment.  Only the
+    first process of a name in a log file, ie, before any restart,
+    is taken, and put on a grid of step seconds (see
+    resample_processes() for how and align).
 
-    series -- a list of string of timestamp
+    log_filenames -- the names of the 2 log files, in order.  They
+                     must differ.
 
     Behaviour:
-        >>> time_series = [
-        ... '4/3/2007 10:00:37 AM',
-        ... '4/3/2007 12:00:00 PM',
-        ... '4/3/2007 11:59:57 PM',
-        ... '4/4/2007',
-        ... ]
-        >>> from plot_complus import make_time_series
-        >>> make_time_series(time_series)
-        [0.0, 119.38333333333334, 839.33333333333337, 839.38333333333333]
+        >>> s = DefaultSeries("%ProcessorTime")
+        >>> runs = []
+        >>> for filename, pid, start, values in [("a.txt", 16520, 900, [9]),
+        ...                                      ("a.txt", 6520, 0, [1, 5, 2]),
+        ...                                      ("b.txt", 7, 0, [4, 4])]:
+        ...     p = Process("App(%d)" % pid, filename)
+        ...     for i, value in enumerate(values):
+        ...         p.add_sample(start + 60.0 * i, [s], [value])
+        ...     runs.append(p)
+        >>> d = diff_processes(runs, ["a.txt", "b.txt"], 60)[0]
+        >>> d.id, d.time_series, d.get("%ProcessorTime")
+        ('App(b.txt - a.txt) diff', array('d', [0.0, 60.0]), array('d', [3.0, -1.0]))
     """
-    def get_sec(timestamp):
-        try:
-            return mktime(strptime(timestamp, "%m/%d/%Y %I:%M:%S %p"))
-        except ValueError:
-            # If the time is on the dot (00:00:00),
-            # only date will be shown.
-            return mktime(strptime(timestamp, "%m/%d/%Y"))
+    first = {}
+    for p in processes:
+        if p.log_filename not in log_filenames or len(p.time_series) == 0:
+            continue
+        key = (p.process_name, p.log_filename)
+        if key not in first or \
+                p.time_series[0] < first[key].time_series[0]:
+            first[key] = p
+
+    runs = {}
+    for p in resample_processes(first.values(), step, how, align):
+        runs.setdefault(p.process_name, {})[p.log_filename] = p
 
-    zero = get_sec(series[0])
-    return [(get_sec(t) - zero) / 60 for t in series]
+    diffs = []
+    for name, by_log in runs.iteritems():
+        logs = [f for f in log_filenames if f in by_log]
+        if len(logs) < 2:
+            continue
+        before, after = by_log[logs[0]], by_log[logs[1]]
+        times = numpy.intersect1d(as_ndarray(before.time_series),
+                                  as_ndarray(after.time_series))
+        d = Process("%s(%s - %s)" % (name, logs[1], logs[0]), "diff")
+        d.time_series.fromstring(times.tostring())
+        for series in before._series:
+            if series not in after._series:
+                continue
+            values = [as_ndarray(p.get(series))[numpy.searchsorted(
+                      as_ndarray(p.time_series), times)]
+                      for p in (before, after)]
+            d.column(series).fromstring((values[1] - values[0]).tostring())
+        diffs.append(d)
+    return sorted(diffs, key=process_sort_key)
 
 
 class Sizer:
@@ -621,58 +3477,867 @@ class Sizer:
         return [0.1, (self.highest_id - graph_id) * self.inc + 0.075, 0.85, self.inc]
 
 
-def plot_graph(processes, series_filter, save_file_path=None):
+STATS_FIELDS = ("process", "id", "log", "series", "unit", "samples", "first",
+                "last", "min", "max", "mean", "p50", "p95", "p99",
+                "growth_per_hour")
+STATS_FORMATS = ("csv", "json")
+
+
+def process_stats(processes, series_filter):
+    """
+    Return the summary statistics of the series of some processes
+    as a list of dict, one per series of a process, with the keys
+    in STATS_FIELDS.  Values are in the unit of their series, and
+    the growth is in that unit per hour.
+
+    processes -- a list of SummaryProcess instance.
+
+    Behaviour:
+        >>> sf = SeriesFilter([("%ProcessorTime", "DefaultSeries")])
+        >>> sf.initialize(["Time", "ComputerName", "ProcessName(ID)",
+        ...                "%ProcessorTime"])
+        >>> p = SummaryProcess("RBCWSSession(1234)", "log.txt")
+        >>> for i in range(100):
+        ...     p.add_sample(1000000000 + 60 * i, sf.series, [i % 10])
+        >>> row = process_stats([p], sf)[0]
+        >>> row["process"], row["id"], row["samples"], row["max"]
+        ('RBCWSSession', '1234', 100, 9.0)
+        >>> round(row["p50"]), round(row["p95"])
+        (4.0, 9.0)
+    """
+    rows = []
+    for p in processes:
+        p.flush()
+        for s in series_filter.series:
+            stats = p.stats.get(s.name)
+            if stats is None or stats.count == 0:
+                continue
+            row = {
+                "process": p.process_name,
+                "id": p.process_id,
+                "log": p.log_filename,
+                "series": s.name,
+                "unit": s.unit.strip("()"),
+                "samples": stats.count,
+                "first": strftime("%Y-%m-%d %H:%M:%S", localtime(stats.first)),
+                "last": strftime("%Y-%m-%d %H:%M:%S", localtime(stats.last)),
+                "min": stats.low,
+                "max": stats.high,
+                "mean": stats.mean(),
+                "growth_per_hour": stats.growth_per_hour(),
+            }
+            for q in (0.5, 0.95, 0.99):
+                row["p%d" % round(q * 100)] = stats.quantile(q)
+            rows.append(row)
+    return rows
+
+
+def write_stats(rows, format, out=sys.stdout):
+    """
+    Write the rows of process_stats() as a CSV table (with a
+    header line) or as a JSON list of objects.
+
+    format -- one of STATS_FORMATS.
+    out -- a file object.
+    """
+    if format == "json":
+        json.dump(rows, out, indent=1, sort_keys=True)
+        out.write("\n")
+        return
+
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(STATS_FIELDS)
+    for row in rows:
+        writer.writerow([row[field] for field in STATS_FIELDS])
+
+
+def find_leaks(processes, series_filter):
+    """
+    Rank the processes by the growth of their memory series (the
+    MemorySeries of the series filter), largest first, to point
+    out the ones leaking memory.  Return a list of dict, one per
+    process name and memory series, with the keys:
+        process -- the process name.
+        series, unit -- the memory series.
+        restarts -- the number of times the process restarted,
+                    ie, its process ID changed.
+        samples, hours -- the samples and the time they cover.
+        growth_per_hour -- the growth, in unit per hour.
+        fit -- how well a straight line fits the samples,
+               between 0 and 1 (r squared).
+        peak -- the highest value.
+
+    A restart drops the memory of a process, so a straight line
+    is not fitted to all of its samples, but to each run of one
+    process ID, all with the same slope (a least squares fit with
+    an intercept per process ID).  The statistics of a process ID
+    spread over many logs are merged first.
+
+    processes -- a list of SummaryProcess instance.
+
+    Behaviour:
+        >>> sf = SeriesFilter([("PrivateBytes", "MemorySeries")])
+        >>> sf.initialize(["Time", "ComputerName", "ProcessName(ID)",
+        ...                "PrivateBytes"])
+        >>> processes = []
+        >>> for id, start in [("10", 0), ("11", 36000)]:
+        ...     # 2 MB/hour, from 20 MB after each restart.
+        ...     p = SummaryProcess("dllhost(%s)" % id, "log.txt")
+        ...     for minute in range(600):
+        ...         p.add_sample(start + minute * 60, sf.series,
+        ...                      [20 + minute / 30.0])
+        ...     processes.append(p)
+        >>> p = SummaryProcess("Idle(0)", "log.txt")
+        >>> for minute in range(600):
+        ...     p.add_sample(minute * 60, sf.series, [1.0])
+        >>> processes.append(p)
+        >>> leaks = find_leaks(processes, sf)
+        >>> [(l["process"], l["restarts"], l["samples"]) for l in leaks]
+        [('dllhost', 1, 1200), ('Idle', 0, 600)]
+        >>> round(leaks[0]["growth_per_hour"], 6), round(leaks[0]["fit"], 6)
+        (2.0, 1.0)
+        >>> round(leaks[0]["hours"], 2), round(leaks[0]["peak"], 2)
+        (19.97, 39.97)
+    """
+    memory = [s for s in series_filter.series if isinstance(s, MemorySeries)]
+
+    # (process name, series) -> {process ID: SeriesStats}
+    runs = {}
+    for p in processes:
+        p.flush()
+        for s in memory:
+            stats = p.stats.get(s.name)
+            if stats is None or stats.count == 0:
+                continue
+            by_id = runs.setdefault((p.process_name, s), {})
+            by_id.setdefault(p.process_id, SeriesStats()).merge(stats)
+
+    leaks = []
+    for (name, s), by_id in runs.iteritems():
+        stt = sty = syy = 0.0
+        samples, seconds, peak = 0, 0.0, None
+        for stats in by_id.itervalues():
+            spreads = stats.spreads()
+            stt, sty, syy = stt + spreads[0], sty + spreads[1], syy + spreads[2]
+            samples += stats.count
+            seconds += stats.last - stats.first
+            peak = max(peak, stats.high)
+
+        growth, fit = 0.0, 0.0
+        if stt > 0:
+            growth = sty / stt * 3600
+            if syy > 0:
+                fit = sty * sty / (stt * syy)
+        leaks.append({
+            "process": name,
+            "series": s.name,
+            "unit": s.unit.strip("()"),
+            "restarts": len(by_id) - 1,
+            "samples": samples,
+            "hours": seconds / 3600,
+            "growth_per_hour": growth,
+            "fit": fit,
+            "peak": peak,
+        })
+
+    leaks.sort(key=lambda l: (-l["growth_per_hour"], l["process"]))
+    return leaks
+
+
+def write_leaks(leaks, out=sys.stdout):
+    """
+    Write the ranking of find_leaks() as a table.
+    """
+    print >> out, "%4s  %13s  %5s  %8s  %8s  %10s  %-14s %s" % ("Rank",
+            "Growth (/h)", "Fit", "Restarts", "Hours", "Peak", "Series",
+            "Process")
+    for rank, l in enumerate(leaks):
+        print >> out, "%4d  %13.4f  %5.2f  %8d  %8.1f  %10.2f  %-14s %s" % (
+                rank + 1, l["growth_per_hour"], l["fit"], l["restarts"],
+                l["hours"], l["peak"], "%s %s" % (l["series"], l["unit"]),
+                l["process"])
+
+
+class Profile:
+    """
+    Record what each stage of a run costs (see --profile): its wall
+    time, the log rows scanned, the rows of the processes we are
+    interested in, the samples kept, the bytes of log read, and the
+    peak RSS of the run so far.  The hot stages, the ones matching
+    hot_stage, can also be run under cProfile, their statistics
+    saved to dump_path.
+
+    Behaviour:
+        >>> profile = Profile()
+        >>> counts = {"rows_scanned": 10, "rows_matched": 0, "bytes_read": 0}
+        >>> record = profile.start("parse log1.txt", counts)
+        >>> counts["rows_scanned"] += 5
+        >>> profile.stop(record)
+        >>> profile.stages[0]["stage"], profile.stages[0]["rows_scanned"]
+        ('parse log1.txt', 5)
+
+    A hot stage run within another one keeps cProfile on until the
+    outer one stops:
+        >>> profile = Profile("*", "profile.out")
+        >>> outer = profile.start("plot_graph")
+        >>> inner = profile.start("make_time_series")
+        >>> profile.stop(inner)
+        >>> profile.hot_depth
+        1
+        >>> profile.stop(outer)
+        >>> profile.hot_depth
+        0
+    """
+    COUNTS = ("rows_scanned", "rows_matched", "bytes_read")
+
+    def __init__(self, hot_stage="parse *", dump_path=None):
+        self.stages = []
+        self.hot_stage = hot_stage
+        self.dump_path = dump_path
+        self.profiler = None
+        self.hot_depth = 0      # The hot stages running, one in another.
+        if dump_path is not None:
+            try:
+                import cProfile
+            except ImportError:
+                raise UsageError("--profile-dump needs Python 2.5 or later!")
+            self.profiler = cProfile.Profile()
+
+    def start(self, stage, counts=None):
+        """
+        Start recording a stage.  Return its record, for stop().
+
+        counts -- a dict of the counts in COUNTS so far, eg, the
+                  counts of a LogParser, or None.
+        """
+        record = {"stage": stage, "counts": counts,
+                  "hot": self.profiler is not None and
+                         fnmatchcase(stage, self.hot_stage)}
+        if counts is not None:
+            record["before"] = dict(counts)
+        if record["hot"]:
+            if self.hot_depth == 0:
+                self.profiler.enable()
+            self.hot_depth += 1
+        record["started"] = clock()
+        return record
+
+    def stop(self, record, processes=()):
+        """
+        Stop recording a stage.
+
+        processes -- the Process instances the stage kept.
+        """
+        seconds = clock() - record.pop("started")
+        if record.pop("hot"):
+            self.hot_depth -= 1
+            if self.hot_depth == 0:
+                self.profiler.disable()
+        record["seconds"] = seconds
+        counts = record.pop("counts")
+        before = record.pop("before", None)
+        for name in self.COUNTS:
+            if counts is None:
+                record[name] = 0
+            else:
+                record[name] = counts[name] - before[name]
+        record["samples"] = sum([self.samples(p) for p in processes])
+        record["peak_rss"] = peak_rss()
+        self.stages.append(record)
+
+    def samples(p):
+        """
+        Return the number of samples kept by a process: its points,
+        or for a SummaryProcess, the samples summed up.
+        """
+        if isinstance(p, SummaryProcess):
+            return max([0] + [s.count for s in p.stats.values()]) + \
+                    len(p.time_series)
+        return len(p.time_series)
+    samples = staticmethod(samples)
+
+    def finish(self, out=sys.stderr):
+        """
+        Write the table of the stages, and save the cProfile
+        statistics, if any.
+        """
+        print >> out, "%9s  %10s  %10s  %10s  %9s  %9s  %s" % ("Seconds",
+                "Scanned", "Matched", "Samples", "Read (MB)", "RSS (MB)",
+                "Stage")
+        for s in self.stages:
+            print >> out, "%9.3f  %10d  %10d  %10d  %9.1f  %9s  %s" % (
+                    s["seconds"], s["rows_scanned"], s["rows_matched"],
+                    s["samples"], s["bytes_read"] / 1048576.0,
+                    format_rss(s["peak_rss"]), s["stage"])
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.dump_path)
+            print >> out, "cProfile statistics of %s saved to %s." % (
+                    self.hot_stage, self.dump_path)
+
+
+def peak_rss():
+    """
+    Return the peak resident set size, in MB, of this process or
+    of its largest worker process, None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == "darwin":
+        return peak / 1048576.0     # In bytes.
+    return peak / 1024.0            # In KB.
+
+
+def format_rss(mb):
+    if mb is None:
+        return "-"
+    return "%.1f" % mb
+
+
+def plot_graph(processes, series_filter, save_file_path=None, profile=None,
+               draw=None):
     """
     Create a graph.  Either display the graph or save the
     graph. This function will only create ONE graph.
 
+    pylab, with the GUI toolkit of its backend, is only imported to
+    display the graph; a saved graph only needs the Agg backend.
+
     processes -- a list of Process instance.
     save_file_path -- If not None, save the graph to the file path
                       specified by this parameter (a string).
+    profile -- if not None, a Profile instance recording the stages
+               of drawing the graph.
+    draw -- the function drawing the graph on a figure, draw_graph()
+            if None.
+    """
+    if save_file_path != None:
+        save_graph(processes, series_filter, save_file_path, profile, draw)
+        return
+
+    import pylab as g
+    figure = g.figure(figsize=(12, 7))
+    (draw or draw_graph)(figure, processes, series_filter, profile)
+    g.show()
+
+
+def save_graph(processes, series_filter, save_file_path, profile=None,
+               draw=None):
+    """
+    Save a graph to a file with the Agg backend, without going
+    through the pylab state machine or a GUI toolkit.  The figure
+    is gone as soon as it is saved, so any number of graphs can be
+    saved in a row (see -a).
+
+    processes -- a list of Process instance.
+    save_file_path -- the file path to save the graph to.
+    profile -- if not None, a Profile instance recording the saving
+               of the graph.
+    draw -- the function drawing the graph on a figure, draw_graph()
+            if None.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    if profile is not None:
+        record = profile.start("plot_graph %s"
+                               % os.path.basename(save_file_path))
+    figure = Figure(figsize=(12, 7))
+    FigureCanvasAgg(figure)
+    (draw or draw_graph)(figure, processes, series_filter, profile)
+    figure.savefig(save_file_path, orientation='landscape')
+    if profile is not None:
+        profile.stop(record, processes)
+
+
+def save_graphs(graphs, jobs=1, profile=None):
+    """
+    Save a number of graphs with save_graph(), on up to jobs
+    worker processes at the same time.
+
+    graphs -- a list of (processes, series_filter, save_file_path).
+    profile -- if not None, a Profile instance recording the saving
+               of each graph, or of them all with worker processes.
+    """
+    if jobs <= 1 or len(graphs) <= 1:
+        for processes, series_filter, save_file_path in graphs:
+            save_graph(processes, series_filter, save_file_path, profile)
+    else:
+        if profile is not None:
+            record = profile.start("save_graphs %d graphs" % len(graphs))
+        pool = multiprocessing.Pool(min(jobs, len(graphs)))
+        try:
+            pool.map(_save_graph_in_worker, graphs, 1)
+        finally:
+            pool.terminate()
+        if profile is not None:
+            profile.stop(record, [p for g in graphs for p in g[0]])
+
+
+def _save_graph_in_worker(graph):
+    """
+    Save a graph in a worker process of the pool used by
+    save_graphs().
+
+    graph -- a (processes, series_filter, save_file_path) tuple.
+    """
+    processes, series_filter, save_file_path = graph
+    save_graph(processes, series_filter, save_file_path)
+
+
+def group_by_process_name(processes):
+    """
+    Return the processes grouped by process name, eg, a group per
+    COM+ application from all log files, as a sorted list of
+    (process name, list of Process instance).
+
+    Behaviour:
+        >>> processes = [Process("b(1)", "log1.txt"),
+        ...              Process("a(2)", "log1.txt"),
+        ...              Process("b(3)", "log2.txt")]
+        >>> [(name, [p.id for p in group])
+        ...  for name, group in group_by_process_name(processes)]
+        [('a', ['a(2) log1.txt']), ('b', ['b(1) log1.txt', 'b(3) log2.txt'])]
+    """
+    groups = {}
+    for p in processes:
+        groups.setdefault(p.process_name, []).append(p)
+    return sorted(groups.items(), key=lambda group: group[0].lower())
+
+
+class Report:
+    """
+    A multi-page PDF of graphs, a page per group of processes, and
+    optionally an HTML index of the pages with a thumbnail of each
+    (see --report).
+
+    The figure and its axes (see Sizer) are made once.  A page only
+    puts the samples of its processes into the lines drawn for the
+    page before, adding lines when it has more processes, so a page
+    costs little more than saving it, and memory does not grow
+    with the number of pages.
+    """
+
+    THUMBNAIL_DPI = 20
+
+    def __init__(self, series_filter, pdf_path, html_path=None):
+        """
+        pdf_path -- the file path of the PDF.
+        html_path -- if not None, the file path of the HTML index.
+                     The thumbnails are saved to a folder next to it.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        self.series_filter = series_filter
+        self.pdf_path = pdf_path
+        self.html_path = html_path
+        self.figure = Figure(figsize=(12, 7))
+        FigureCanvasAgg(self.figure)
+        self.title = self.figure.suptitle("")
+        self.legend = None
+        self.fills = []
+        self.pages = []         # The title of each page.
+
+        sizer = Sizer(len(series_filter.series))
+        self.axes = []
+        for count, series in enumerate(series_filter.series):
+            ax = self.figure.add_axes(sizer.coordinates(count))
+            ax.set_ylabel("%s %s" % (series.name, series.unit))
+            ax.grid(True)
+            for label in ax.get_xticklabels():
+                label.set_visible(False)
+            self.axes.append(ax)
+        for label in ax.get_xticklabels():
+            label.set_visible(True)
+        ax.set_xlabel("Elapsed Time (min)")
+        self.lines = [[] for ax in self.axes]   # Line2D, per axes.
+
+        if html_path is not None:
+            self.thumbnail_dir = os.path.splitext(html_path)[0] + "_thumbnails"
+            if not os.path.isdir(self.thumbnail_dir):
+                os.makedirs(self.thumbnail_dir)
+        self.pdf = PdfPages(pdf_path)
+
+    def add_page(self, title, processes):
+        """
+        Add a page with the graph of the processes.
+        """
+        for fill in self.fills:
+            fill.remove()
+        self.fills = []
+
+        labels = []
+        for p in processes:
+            colour = COLOURS.next()
+            labels.append(p.id)
+            time_series = as_ndarray(make_time_series(p.time_series))
+            for ax, lines, series in zip(self.axes, self.lines,
+                                         self.series_filter.series):
+                if len(lines) < len(labels):
+                    line, = ax.plot([], [], series.marker)
+                    lines.append(line)
+                line = lines[len(labels) - 1]
+                x = time_series
+                y = as_ndarray(p.get(series.name))
+                envelope = p.envelope(series.name)
+                if envelope is None:
+                    x, y = downsample(x, y, int(ax.bbox.width))
+                else:
+                    self.fills.append(ax.fill_between(x,
+                            as_ndarray(envelope[0]), as_ndarray(envelope[1]),
+                            color=colour, alpha=0.3, linewidth=0))
+                line.set_data(x, y)
+                line.set_color(colour)
+                line.set_visible(True)
+
+        for ax, lines in zip(self.axes, self.lines):
+            # Hide the lines left over from a page with more processes.
+            for line in lines[len(labels):]:
+                line.set_data([], [])
+                line.set_visible(False)
+            ax.relim()
+            ax.autoscale_view()
+
+        if self.legend is not None:
+            self.legend.remove()
+        self.legend = add_legend(self.figure, self.lines[0][:len(labels)],
+                                 labels)
+        self.title.set_text(title)
+        self.pdf.savefig(self.figure)
+        self.pages.append(title)
+        if self.html_path is not None:
+            self.figure.savefig(self._thumbnail_path(len(self.pages)),
+                                dpi=self.THUMBNAIL_DPI)
+
+    def close(self):
+        """
+        Finish the PDF, and write the HTML index, if any.
+        """
+        self.pdf.close()
+        if self.html_path is None:
+            return
+
+        html_dir = os.path.dirname(os.path.abspath(self.html_path))
+        pdf = relative_path(self.pdf_path, html_dir)
+        out = open(self.html_path, "w")
+        try:
+            out.write("<html>\n<head><title>%s</title></head>\n<body>\n"
+                    "<h1>%s</h1>\n" % (escape_html(pdf), escape_html(pdf)))
+            for number, title in enumerate(self.pages):
+                out.write('<a href="%s#page=%d"><img src="%s" alt="%s"'
+                        ' title="%s"></a>\n' % (escape_html(pdf), number + 1,
+                        escape_html(relative_path(
+                                self._thumbnail_path(number + 1), html_dir)),
+                        escape_html(title), escape_html(title)))
+            out.write("</body>\n</html>\n")
+        finally:
+            out.close()
+
+    def _thumbnail_path(self, number):
+        return os.path.join(self.thumbnail_dir, "%04d.png" % number)
+
+
+def relative_path(path, start):
+    """
+    Return a path relative to the start folder, as a URL path.
+
+    Behaviour:
+        >>> relative_path("/reports/graphs/report.pdf", "/reports")
+        'graphs/report.pdf'
+        >>> relative_path("/reports/report.pdf", "/reports/html")
+        '../report.pdf'
+    """
+    # Not os.path.relpath(), which needs Python 2.6.
+    parts = os.path.abspath(path).split(os.sep)
+    start_parts = os.path.abspath(start).split(os.sep)
+    common = 0
+    while common < min(len(parts), len(start_parts)) and \
+            parts[common] == start_parts[common]:
+        common += 1
+    return "/".join([".."] * (len(start_parts) - common) + parts[common:])
+
+
+def escape_html(text):
     """
-    g.figure(figsize=(12, 7))
+    Behaviour:
+        >>> escape_html('<a> & "b"')
+        '&lt;a&gt; &amp; &quot;b&quot;'
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(
+            ">", "&gt;").replace('"', "&quot;")
+
+
+def draw_graph(figure, processes, series_filter, profile=None):
+    """
+    Draw the graph of the processes on a matplotlib Figure, an
+    axes per series, one above the other.
 
+    figure -- a matplotlib Figure instance.
+    processes -- a list of Process instance.
+    profile -- if not None, a Profile instance recording the time
+               series made for each process.
+    """
     handles = []
     labels = []
     sizer = Sizer(len(series_filter.series))
 
+    axes = []
+    for count, series in enumerate(series_filter.series):
+        ax = figure.add_axes(sizer.coordinates(count))
+        ax.set_ylabel("%s %s" % (series.name, series.unit))
+        ax.grid(True)
+        for label in ax.get_xticklabels():
+            label.set_visible(False)
+        axes.append(ax)
+
     for p in processes:
+        if profile is not None:
+            record = profile.start("make_time_series %s" % p.id)
         time_series = make_time_series(p.time_series)
+        if profile is not None:
+            profile.stop(record, [p])
         colour = COLOURS.next()
         print p.id, colour
 
-        for count, series in enumerate(series_filter.series):
-            ax = g.axes(sizer.coordinates(count))
+        for ax, series in zip(axes, series_filter.series):
             try:
-                h = g.plot(time_series, p.get(series.name),
-                        series.marker, color=colour, label=p.id)
+                x = as_ndarray(time_series)
+                y = as_ndarray(p.get(series.name))
+                envelope = p.envelope(series.name)
+                if envelope is None:
+                    x, y = downsample(x, y, int(ax.bbox.width))
+                h = ax.plot(x, y, series.marker, color=colour, label=p.id)
+                if envelope is not None:
+                    # Shade the min/max of folded samples, so spikes
+                    # still show on a downsampled line.
+                    ax.fill_between(as_ndarray(time_series),
+                            as_ndarray(envelope[0]), as_ndarray(envelope[1]),
+                            color=colour, alpha=0.3, linewidth=0)
             except:
                 print "Error in generating graph for %s of %s!" \
                         % (p.id, series.name)
                 raise
 
-            g.ylabel("%s %s" % (series.name, series.unit))
-            g.grid(True)
-            g.setp(ax.get_xticklabels(), visible=False)
-
         handles.append(h)
         labels.append(p.id)
 
-    g.setp(ax.get_xticklabels(), visible=True)
-    g.xlabel("Elapsed Time (min)")
-    legend = g.figlegend(handles, labels, 'lower right',
+    for label in ax.get_xticklabels():
+        label.set_visible(True)
+    ax.set_xlabel("Elapsed Time (min)")
+    add_legend(figure, handles, labels)
+
+
+def draw_small_multiples(figure, processes, series_filter, profile=None):
+    """
+    Draw a small graph per application and series on a matplotlib
+    Figure, an application per row and a series per column, with a
+    line per host (see Farm), so the hosts of a farm are compared
+    application by application at a glance.
+
+    figure -- a matplotlib Figure instance.
+    processes -- a list of Process instance, named Application(Host).
+    profile -- if not None, a Profile instance recording the time
+               series made for each process.
+    """
+    groups = dict(group_by_process_name(processes))
+    applications = sorted(groups.keys(), key=lambda name: name.lower())
+    series = series_filter.series
+
+    figure.set_size_inches(12, max(7, 1.5 * len(applications)))
+    sizer = Sizer(len(applications))
+    width = 0.85 / len(series)
+    colours = {}
+    handles = []
+    labels = []
+    for row, application in enumerate(applications):
+        left, bottom, dummy, height = sizer.coordinates(row)
+        for column, s in enumerate(series):
+            ax = figure.add_axes([left + column * width, bottom,
+                                  width * 0.9, height * 0.85])
+            if row == 0:
+                ax.set_title("%s %s" % (s.name, s.unit), fontsize=9)
+            if column == 0:
+                ax.set_ylabel(application, fontsize=8)
+            ax.grid(True)
+            for label in ax.get_yticklabels():
+                label.set_fontsize(7)
+            for label in ax.get_xticklabels():
+                label.set_fontsize(7)
+                label.set_visible(row == len(applications) - 1)
+
+            for p in groups[application]:
+                if profile is not None:
+                    record = profile.start("make_time_series %s" % p.id)
+                time_series = make_time_series(p.time_series)
+                if profile is not None:
+                    profile.stop(record, [p])
+                if p.process_id not in colours:
+                    colours[p.process_id] = COLOURS.next()
+                x, y = downsample(as_ndarray(time_series),
+                        as_ndarray(p.get(s.name)), int(ax.bbox.width))
+                h = ax.plot(x, y, s.marker, color=colours[p.process_id])
+                if p.process_id not in labels:
+                    handles.append(h)
+                    labels.append(p.process_id)
+
+    ax.set_xlabel("Elapsed Time (min)")
+    add_legend(figure, handles, labels)
+
+
+def add_legend(figure, handles, labels):
+    """
+    Add the legend of the processes to a figure.
+    Return the legend.
+    """
+    legend = figure.legend(handles, labels, 'lower right',
             pad=0.1, labelsep=0.0025, handlelen=0.025,
             handletextsep=0.01, axespad=0.08)
 
     for t in legend.get_texts():
         t.set_fontsize(8)
+    return legend
 
-    if save_file_path != None:
-        g.savefig(save_file_path, orientation='landscape')
-        g.close("all")
-    else:
+
+class LiveGraph:
+    """
+    A graph that keeps itself up to date with log files still
+    being written.  On every tick of a timer, the lines appended
+    to the logs are parsed (see LogFollower) and the new samples
+    are put into the existing lines of the graph, which are then
+    redrawn alone over a saved background (blitting).  The whole
+    figure is only redrawn when a new process shows up, or when a
+    line grows out of the axes.
+    """
+
+    # Room left at the right end of the time axis for new samples,
+    # as a fraction of the time shown.
+    HEADROOM = 0.1
+
+    def __init__(self, follower, series_filter, interval):
+        """
+        follower -- a LogFollower instance.
+        interval -- the time between two updates, in seconds.
+        """
+        import pylab as g
+        self.follower = follower
+        self.series_filter = series_filter
+        self.figure = g.figure(figsize=(12, 7))
+        self.lines = {}         # Process id -> list of Line2D.
+        self.zeros = {}         # Process id -> first timestamp.
+        self.followed = {}      # Process id -> Process drawn.
+        self.handles = []
+        self.labels = []
+        self.legend = None
+        self.backgrounds = None
+
+        sizer = Sizer(len(series_filter.series))
+        self.axes = []
+        for count, series in enumerate(series_filter.series):
+            ax = g.axes(sizer.coordinates(count))
+            g.ylabel("%s %s" % (series.name, series.unit))
+            g.grid(True)
+            g.setp(ax.get_xticklabels(), visible=False)
+            self.axes.append(ax)
+        g.setp(ax.get_xticklabels(), visible=True)
+        g.xlabel("Elapsed Time (min)")
+
+        canvas = self.figure.canvas
+        canvas.mpl_connect("draw_event", self._on_draw)
+        self.timer = canvas.new_timer(interval=int(interval * 1000))
+        self.timer.add_callback(self.update)
+
+    def show(self):
+        import pylab as g
+        self.update()
+        self.timer.start()
         g.show()
 
+    def update(self):
+        """
+        Poll the log files and put the new samples on the graph.
+        """
+        rescale = False
+        for p in self.follower.poll():
+            if p.id not in self.lines:
+                self._add_lines(p)
+                rescale = True
+            elif self.followed[p.id] is not p:
+                # Its log file was started over: a new process.
+                self.zeros[p.id] = p.time_series[0]
+                rescale = True
+            self.followed[p.id] = p
+
+            time_series = (as_ndarray(p.time_series) - self.zeros[p.id]) / 60
+            for line, series in zip(self.lines[p.id],
+                    self.series_filter.series):
+                # Copy: the array of the process grows later on.
+                x, y = downsample(time_series,
+                        as_ndarray(p.get(series.name)),
+                        int(line.axes.bbox.width))
+                line.set_data(x, y.copy())
+                if not rescale and len(x) > 0:
+                    rescale = self._is_outside(line.axes, x, y)
+
+        if rescale:
+            self._rescale()
+            self.figure.canvas.draw()   # Blits the lines too, see _on_draw.
+        else:
+            self._blit()
+
+    def _add_lines(self, p):
+        colour = COLOURS.next()
+        print p.id, colour
+        self.zeros[p.id] = p.time_series[0]
+        lines = []
+        for ax, series in zip(self.axes, self.series_filter.series):
+            line, = ax.plot([], [], series.marker, color=colour,
+                    label=p.id, animated=True)
+            lines.append(line)
+        self.lines[p.id] = lines
+        self.handles.append(lines[0])
+        self.labels.append(p.id)
+
+        if self.legend is not None:
+            self.legend.remove()
+        self.legend = add_legend(self.figure, self.handles, self.labels)
+
+    def _is_outside(self, ax, x, y):
+        left, right = ax.get_xlim()
+        bottom, top = ax.get_ylim()
+        return x[0] < left or x[-1] > right or \
+                y.min() < bottom or y.max() > top
+
+    def _rescale(self):
+        for ax in self.axes:
+            ax.relim()
+            ax.autoscale_view()
+            left, right = ax.get_xlim()
+            ax.set_xlim(left, right + (right - left) * self.HEADROOM,
+                    auto=None)
+
+    def _on_draw(self, event):
+        """
+        Save the freshly drawn background of the axes, and draw
+        the (animated) lines over it.
+        """
+        canvas = self.figure.canvas
+        self.backgrounds = [canvas.copy_from_bbox(ax.bbox)
+                            for ax in self.axes]
+        self._blit()
+
+    def _blit(self):
+        if self.backgrounds is None:
+            return
+        canvas = self.figure.canvas
+        for ax, background in zip(self.axes, self.backgrounds):
+            canvas.restore_region(background)
+            for line in ax.get_lines():
+                ax.draw_artist(line)
+            canvas.blit(ax.bbox)
+
 
 def run_test_and_exit():
     import doctest
@@ -688,6 +4353,113 @@ def main():
                 help="Save the graph to a file instead of displaying it.")
         p.add_option("-a", "--for-each-app", dest="save_dir_path",
                 help="Generate a graph for each COM+ application and save them.")
+        p.add_option("-m", "--match", dest="match", type="choice",
+                choices=ProcessFilter.MODES, default="regex",
+                help="How the process patterns match the process names:"
+                " regex, exact, prefix or glob [default: %default].")
+        p.add_option("--series", dest="series",
+                help="The comma separated series to show, eg, any column of"
+                " the logs, %KernelTime or PrivateBytesPerThread, or all"
+                " [default: %ProcessorTime,PrivateBytes].")
+        p.add_option("-r", "--resolution", dest="resolution", type="int",
+                help="Fold the samples of each process into about this many"
+                " points (mean, min and max) while parsing, so long logs"
+                " can be plotted in bounded memory.")
+        p.add_option("-j", "--jobs", dest="jobs", type="int", default=1,
+                help="Parse up to this many log files (or, with -a, save up"
+                " to this many graphs) at the same time, each in its own"
+                " process.")
+        p.add_option("-s", "--stats", dest="stats", type="choice",
+                choices=STATS_FORMATS,
+                help="Print the summary statistics of each process (count,"
+                " min, max, mean, p50, p95, p99 and growth per hour of each"
+                " series) as a csv or json table instead of plotting.")
+        p.add_option("-l", "--leaks", dest="leaks", action="store_true",
+                default=False,
+                help="Rank the processes by the growth of their memory"
+                " (per hour, across restarts) to find memory leaks.")
+        p.add_option("--top", dest="top", type="int",
+                help="With -l, then plot the memory of this many processes"
+                " from the top of the ranking.")
+        p.add_option("-e", "--export", dest="export_path",
+                help="Save the parsed logs, with all their columns, to this"
+                " folder as NumPy .npy files, which can be given instead of"
+                " the logs later on.")
+        p.add_option("--from", dest="since",
+                help="Only use the samples from this time on, given as"
+                " YYYY-MM-DD HH:MM[:SS] or as in the log.")
+        p.add_option("--to", dest="until",
+                help="Only use the samples up to this time.")
+        p.add_option("--report", dest="report_path",
+                help="Save the graph of each process name (see -a) as a"
+                " page of this PDF file.")
+        p.add_option("--report-html", dest="report_html_path",
+                help="With --report, also write an HTML index of the pages,"
+                " with a thumbnail of each, to this file.")
+        p.add_option("--farm", dest="farm", type="choice",
+                choices=("hosts",) + Farm.AGGREGATES,
+                help="Compare the applications of the logs (or folders of"
+                " logs) of many hosts, on a common time grid: hosts draws"
+                " an application per row with a line per host, while sum,"
+                " mean or max draws a line per application across hosts.")
+        p.add_option("--step", dest="step", type="float",
+                default=DEFAULT_STEP,
+                help="With --farm or --resample, the seconds between two"
+                " points of the time grid [default: %default].")
+        p.add_option("--resample", dest="resample", type="choice",
+                choices=RESAMPLE_METHODS,
+                help="Put the samples on a uniform time grid, taking the"
+                " mean or max of the samples of each point, or the last"
+                " one carried forward over missing samples (ffill).")
+        p.add_option("--align", dest="align", type="choice",
+                choices=ALIGNMENTS,
+                help="With --resample, start the time of each process at"
+                " its first sample (elapsed), or the time of all processes"
+                " at the first sample of all (clock) [default: elapsed].")
+        p.add_option("--diff", dest="diff", action="store_true",
+                default=False,
+                help="Plot each process in the second log file minus the"
+                " same process in the first one, resampled (by mean unless"
+                " --resample says otherwise).")
+        p.add_option("-f", "--follow", dest="follow", action="store_true",
+                default=False,
+                help="Keep the graph up to date with log files still being"
+                " written, eg, by mon_complus.vbs.")
+        p.add_option("--interval", dest="interval", type="float",
+                default=DEFAULT_FOLLOW_INTERVAL,
+                help="With -f, the seconds between two updates of the graph"
+                " [default: %default].")
+        p.add_option("--window", dest="window", type="float",
+                help="With -f, only keep (and show) the samples of the last"
+                " this many minutes.")
+        p.add_option("--no-cache", dest="use_cache", action="store_false",
+                default=True,
+                help="Do not use (or build) the cache of parsed log files."
+                " The first run on a log file parses all its processes and"
+                " columns to cache them, and later runs load the cache"
+                " instead.  -r, -s and -l do not use the cache.")
+        p.add_option("--cache-dir", dest="cache_dir",
+                default=DEFAULT_CACHE_DIR,
+                help="The folder holding the cache of parsed log files"
+                " [default: %default].")
+        p.add_option("--cache-size", dest="cache_size", type="int",
+                default=DEFAULT_CACHE_SIZE,
+                help="The maximum size (in MB) of the cache of parsed log"
+                " files [default: %default].")
+        p.add_option("--profile", dest="profile", action="store_true",
+                default=False,
+                help="Print what each stage costs (parsing each log file,"
+                " making the time series of each process, saving each"
+                " graph) to the standard error.")
+        p.add_option("--profile-dump", dest="profile_dump",
+                help="With --profile, also run the stages matching"
+                " --profile-stage under cProfile, and save its statistics"
+                " to this file, eg, for pstats.  Not with -j, as the"
+                " worker processes are not profiled.")
+        p.add_option("--profile-stage", dest="profile_stage",
+                default="parse *",
+                help="The stages (a glob pattern) run under cProfile"
+                " [default: %default].")
         (options, args) = p.parse_args()
 
         args_num = len(args)
@@ -702,24 +4474,255 @@ def main():
             raise UsageError("-a cannot be used with the patterns argument!" \
                     " Please use either one.")
 
+        if args_num == 2 and options.report_path:
+            raise UsageError("--report cannot be used with the patterns"
+                    " argument! Please use either one.")
+
+        if options.follow and (options.save_file_path or
+                options.save_dir_path or options.resolution):
+            raise UsageError("-f cannot be used with -o, -a or -r!")
+
+        if options.stats and (options.save_file_path or
+                options.save_dir_path or options.follow or options.resolution):
+            raise UsageError("-s cannot be used with -o, -a, -f or -r!")
+
+        if options.export_path and (options.save_file_path or
+                options.save_dir_path or options.follow or options.resolution
+                or options.stats or options.leaks):
+            raise UsageError("-e cannot be used with -o, -a, -f, -r, -s"
+                    " or -l!")
+
+        if options.follow and (options.since or options.until):
+            raise UsageError("-f cannot be used with --from or --to!")
+
+        if options.follow and options.profile:
+            raise UsageError("-f cannot be used with --profile!")
+
+        if options.report_path and (options.save_file_path or
+                options.save_dir_path or options.follow or options.stats or
+                options.leaks or options.export_path):
+            raise UsageError("--report cannot be used with -o, -a, -f, -s,"
+                    " -l or -e!")
+
+        if options.report_path and \
+                not options.report_path.lower().endswith(".pdf"):
+            raise UsageError("--report must be a .pdf file!")
+
+        if options.report_html_path and not options.report_path:
+            raise UsageError("--report-html must be used with --report!")
+
+        if options.farm and (options.follow or options.resolution or
+                options.stats or options.leaks or options.export_path):
+            raise UsageError("--farm cannot be used with -f, -r, -s, -l"
+                    " or -e!")
+
+        if options.step <= 0:
+            raise UsageError("--step must be a positive number!")
+
+        resample_how = options.resample
+        if resample_how is None and (options.diff or options.align):
+            resample_how = "mean"
+        if resample_how and (options.farm or options.follow or
+                options.resolution or options.stats or options.leaks or
+                options.export_path):
+            raise UsageError("--resample, --align and --diff cannot be used"
+                    " with --farm, -f, -r, -s, -l or -e!")
+
+        if options.profile_dump and not options.profile:
+            raise UsageError("--profile-dump must be used with --profile!")
+
+        if options.profile_dump and options.jobs > 1:
+            # The hot stages would run in the worker processes, out of
+            # reach of cProfile, which would only see the wait for them.
+            raise UsageError("--profile-dump cannot be used with -j!")
+
+        if options.leaks and (options.stats or options.follow):
+            raise UsageError("-l cannot be used with -s or -f!")
+
+        if options.top is not None and (not options.leaks or options.top < 1):
+            raise UsageError("--top must be a positive number, used with -l!")
+
+        if options.leaks and options.top is None and \
+                (options.save_file_path or options.save_dir_path):
+            raise UsageError("-l only plots a graph with --top! Please use"
+                    " --top with -o or -a.")
+
+        if options.stats == "json" and json is None:
+            raise UsageError("-s json needs Python 2.6 or later!")
+
+        if options.interval <= 0:
+            raise UsageError("--interval must be a positive number!")
+
+        if options.window is not None and options.window <= 0:
+            raise UsageError("--window must be a positive number!")
+
+        if options.resolution is not None and options.resolution < 1:
+            raise UsageError("-r must be a positive number!")
+
+        if options.jobs < 1:
+            raise UsageError("-j must be a positive number!")
+
+        if options.jobs > 1 and multiprocessing is None:
+            raise UsageError("-j needs Python 2.6 or later!")
+
+        if options.cache_size < 0:
+            raise UsageError("--cache-size cannot be negative!")
+
         if args[0] == "DOCTEST":
             run_test_and_exit()
         else:
             data_paths = args[0]
 
+        if options.diff:
+            log_filenames = [os.path.basename(os.path.abspath(p))
+                             for p in data_paths.split(",")]
+            if len(log_filenames) != 2:
+                raise UsageError("--diff needs 2 log files!")
+            if log_filenames[0] == log_filenames[1]:
+                raise UsageError("--diff needs 2 log files named apart,"
+                        " not 2 files named %s!" % log_filenames[0])
+
         if args_num == 2:
-            process_filter = ProcessFilter(args[1])
+            process_filter = ProcessFilter(args[1], options.match)
         else:
             process_filter = AllProcesses()
 
-        series_filter = SeriesFilter(SERIES_WE_ARE_INTERESTED_IN)
-        logparser = LogParser(process_filter, series_filter)
-        processes = logparser.parse_logs(data_paths)
+        if options.use_cache:
+            cache_dir = os.path.expanduser(options.cache_dir)
+            cache = LogCache(os.path.abspath(cache_dir),
+                    options.cache_size * 1024 * 1024)
+        else:
+            cache = None
+
+        # main() leaves through sys.exit() in many places: print the
+        # profile on the way out, whichever it is.
+        profile = None
+        if options.profile:
+            profile = Profile(options.profile_stage, options.profile_dump)
+            atexit.register(profile.finish)
+
+        if options.series:
+            series_filter = SeriesFilter(series_preference(options.series))
+        else:
+            series_filter = SeriesFilter(SERIES_WE_ARE_INTERESTED_IN)
+
+        since = until = None
+        if options.since:
+            since = time_option_to_sec(options.since)
+        if options.until:
+            until = time_option_to_sec(options.until)
+        if since is not None and until is not None and since > until:
+            raise UsageError("--from must not be later than --to!")
+
+        # The -f option: Keep showing the logs as they are written.
+        if options.follow:
+            logparser = LogParser(process_filter, series_filter,
+                    jobs=options.jobs, cache=cache)
+            paths = [os.path.abspath(p) for p in data_paths.split(",")]
+            window = None
+            if options.window is not None:
+                window = options.window * 60
+            follower = LogFollower(logparser, paths, window)
+            if not logparser.are_headers_verified:
+                raise UsageError("No header found in the log files!")
+            LiveGraph(follower, series_filter, options.interval).show()
+            sys.exit(0)
+
+        # The -e option: Save what is parsed instead of plotting it.
+        if options.export_path:
+            export_path = os.path.abspath(options.export_path)
+            if os.path.exists(export_path) and \
+                    not os.path.isdir(export_path):
+                raise UsageError("%s is not a directory!" % export_path)
+            if os.path.exists(export_path) and os.listdir(export_path) and \
+                    not LogExport.is_export(export_path):
+                raise UsageError("%s is not empty!" % export_path)
+            logparser = LogParser(process_filter, AllSeries(),
+                    jobs=options.jobs, cache=cache, since=since, until=until,
+                    profile=profile)
+            processes = logparser.parse_logs(data_paths)
+            if len(processes) == 0:
+                raise UsageError("No process matches the given patterns!")
+            LogExport(export_path).save(logparser.header,
+                    dict([(p.id, p) for p in processes]))
+            print "%d processes saved to %s." % (len(processes), export_path)
+            sys.exit(0)
+
+        # The -l option: Rank the processes by memory growth, then
+        # plot the top ones only, if asked to.
+        if options.leaks:
+            logparser = LogParser(process_filter, series_filter,
+                    jobs=options.jobs, cache=cache, summarize=True,
+                    since=since, until=until, profile=profile)
+            processes = logparser.parse_logs(data_paths)
+            if not [s for s in series_filter.series
+                    if isinstance(s, MemorySeries)]:
+                raise UsageError("No memory series to find leaks in!")
+            if profile is not None:
+                record = profile.start("find_leaks")
+            leaks = find_leaks(processes, series_filter)
+            if profile is not None:
+                profile.stop(record, processes)
+            if len(leaks) == 0:
+                raise UsageError("No process matches the given patterns!")
+            write_leaks(leaks)
+            if options.top is None:
+                sys.exit(0)
+
+            names = []
+            for l in leaks:
+                if l["process"] not in names:
+                    names.append(l["process"])
+            process_filter = ProcessFilter(",".join(names[:options.top]),
+                    "exact")
+            series_filter = SeriesFilter([(s.name, s.__class__.__name__)
+                    for s in series_filter.series
+                    if isinstance(s, MemorySeries)])
+
+        # The --farm option: The applications of many hosts, resampled
+        # on a common time grid.
+        draw = None
+        if options.farm:
+            farm = parse_farm(farm_log_paths(data_paths), process_filter,
+                    series_filter, options.step, options.jobs, cache,
+                    since, until, profile)
+            if options.farm == "hosts":
+                processes = farm.processes()
+                draw = draw_small_multiples
+            else:
+                processes = farm.processes(options.farm)
+        else:
+            logparser = LogParser(process_filter, series_filter,
+                    resolution=options.resolution, jobs=options.jobs,
+                    cache=cache, summarize=bool(options.stats), since=since,
+                    until=until, profile=profile)
+            processes = logparser.parse_logs(data_paths)
+
+        # The --resample option: The processes on a uniform time grid,
+        # and the --diff option: Their difference between 2 logs.
+        if options.diff:
+            processes = diff_processes(processes, log_filenames,
+                    options.step, resample_how, options.align or "elapsed")
+            if len(processes) == 0:
+                raise UsageError("No process is found in 2 log files!")
+        elif resample_how:
+            processes = resample_processes(processes, options.step,
+                    resample_how, options.align or "elapsed")
 
         if len(processes) == 0:
             # There is nothing for us to plot, raise error.
             raise UsageError("No process matches the given patterns!")
 
+        # The -s option: Print numbers instead of a plot.
+        if options.stats:
+            if profile is not None:
+                record = profile.start("process_stats")
+            rows = process_stats(processes, series_filter)
+            if profile is not None:
+                profile.stop(record, processes)
+            write_stats(rows, options.stats)
+            sys.exit(0)
+
         # The -a option: Generate plots for all processes and
         # save them in a folder.
         if options.save_dir_path:
@@ -734,16 +4737,33 @@ def main():
 
             # Here we group all processes from all log files with the
             # same process name together, then we will generate
-            # the graph for each group. process_groups is a dict of list.
-            process_groups = {}
-            for p in processes:
-                if p.process_name not in process_groups:
-                    process_groups[p.process_name] = []
-                process_groups[p.process_name].append(p)
-
-            for name, p in process_groups.iteritems():
+            # the graph for each group.
+            graphs = []
+            for name, group in group_by_process_name(processes):
                 save_path = os.path.join(dir_path, name + DEFAULT_EXT)
-                plot_graph(p, series_filter, save_file_path=save_path)
+                graphs.append((group, series_filter, save_path))
+            save_graphs(graphs, options.jobs, profile)
+
+        # The --report option: A page per process name in a PDF.
+        elif options.report_path:
+            # Making sure the paths are reachable.
+            for path in [options.report_path, options.report_html_path]:
+                if path is None:
+                    continue
+                dir_path = os.path.dirname(os.path.abspath(path))
+                if not os.path.isdir(dir_path):
+                    raise UsageError("%s is not a valid directory!"
+                            % dir_path)
+
+            report = Report(series_filter, options.report_path,
+                    options.report_html_path)
+            for name, group in group_by_process_name(processes):
+                if profile is not None:
+                    record = profile.start("report page %s" % name)
+                report.add_page(name, group)
+                if profile is not None:
+                    profile.stop(record, group)
+            report.close()
 
         # The -o option: Generate a plot and save it to a file.
         elif options.save_file_path:
@@ -768,11 +4788,12 @@ def main():
                 print "The graph will be saved in %s." % DEFAULT_EXT
                 save_path = path_without_ext + DEFAULT_EXT
 
-            plot_graph(processes, series_filter, save_file_path=save_path)
+            plot_graph(processes, series_filter, save_file_path=save_path,
+                    profile=profile, draw=draw)
 
         # The interactive option (default): Generate a plot and show it.
         else:
-            plot_graph(processes, series_filter)
+            plot_graph(processes, series_filter, profile=profile, draw=draw)
 
         sys.exit(0)
 